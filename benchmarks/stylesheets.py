@@ -0,0 +1,79 @@
+"""Inlining of examples/mybigproject with and without StylesheetCache.
+
+The example stylesheet is tiny, so ``--rules`` appends generated rules to
+a copy of it to resemble a real mail stylesheet::
+
+    $ python benchmarks/stylesheets.py --rules 2000 --repeat 20
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+import premailer
+
+from lpremailer.inliner import StylesheetCache, transform
+
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       '..', 'examples', 'mybigproject')
+TEMPLATES = os.path.join('templates', 'mail')
+TEMPLATE = os.path.join('hello', 'greetings_dev.html')
+RULE = '.rule-{0} td.cell-{0} {{ color: #{0:06x}; padding: {1}px; }}\n'
+
+
+def prepare(rules):
+    tmpdir = tempfile.mkdtemp()
+    project = os.path.join(tmpdir, 'mybigproject')
+    shutil.copytree(EXAMPLE, project)
+    with open(os.path.join(project, 'static', 'css', 'mail.css'), 'a') as f:
+        for index in range(rules):
+            f.write(RULE.format(index, index % 20))
+    return tmpdir, os.path.join(project, TEMPLATES)
+
+
+def first_stage(templates):
+    from jinja2 import Environment, FileSystemLoader
+    j2_env = Environment(loader=FileSystemLoader(templates),
+                         extensions=['jinja2.ext.i18n'])
+    j2_env.install_null_translations()
+    return j2_env.get_template(TEMPLATE.replace(os.sep, '/')).render()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rules', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir, templates = prepare(args.rules)
+    cwd = os.getcwd()
+    os.chdir(templates)
+    try:
+        html = first_stage(templates)
+        stylesheets = StylesheetCache()
+
+        def uncached():
+            premailer.transform(html, allow_loading_external_files=True)
+
+        def cached():
+            transform(html, stylesheets, allow_loading_external_files=True)
+
+        results = []
+        for name, func in (('premailer', uncached), ('cached', cached)):
+            func()
+            seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+            results.append((name, seconds))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+    print('{} rules, best of {} renders'.format(args.rules, args.repeat))
+    for name, seconds in results:
+        print('{:>10}: {:8.2f}ms'.format(name, seconds * 1000))
+    print('{:>10}: {:8.1f}x'.format('speedup', results[0][1] / results[1][1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Benchmarks of lpremailer on a synthetic template tree.
+
+Scenarios:
+
+- ``cold_render`` renders every dev template with a fresh RenderHandler,
+- ``warm_render`` renders them again with compiled templates and parsed
+  stylesheets in memory, but no rendered outputs nor inlined layouts
+  cached,
+- ``partial_change`` edits a shared partial and renders its dependents,
+- ``css_change`` edits a stylesheet and renders its dependents,
+- ``init`` generates json fixtures for the whole tree,
+- ``init_again`` runs ``init`` once more, with every fixture
+  up to date.
+
+Results are printed and optionally saved as json, which a later run can
+compare against::
+
+    $ python benchmarks/suite.py --templates 200 --output before.json
+    $ python benchmarks/suite.py --templates 200 --compare before.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from tree import generate_tree, partial_path, stylesheet_path
+
+
+SCENARIOS = ('cold_render', 'warm_render', 'partial_change', 'css_change',
+             'init', 'init_again')
+
+
+def cmd_args(**options):
+    args = argparse.Namespace(
+        loadhistory=False, devpostfix='_dev', livepostfix='_live',
+        astext=False, force=False)
+    vars(args).update(options)
+    return args
+
+
+def timed(func):
+    start = time.time()
+    count = func()
+    return {'seconds': time.time() - start, 'templates': count}
+
+
+def render_all(handler):
+    templates = sorted(handler.dependencies.templates)
+    for src_path in templates:
+        handler.proceed(src_path)
+    return len(templates)
+
+
+def render_changed(handler, filepath):
+    with open(filepath, 'a') as f:
+        f.write('\n')
+    templates = handler.targets(filepath)
+    for src_path in sorted(templates):
+        handler.proceed(src_path)
+    return len(templates)
+
+
+def run(args):
+    from lpremailer import main
+    from lpremailer.cache import RenderCache
+    from lpremailer.utils import JsonGenerator, dev_templates
+
+    root = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        here = generate_tree(root, args.templates, args.partials,
+                             args.stylesheets, args.rules, args.fixture_size)
+        os.chdir(here)
+        main.HERE = here
+        results = {}
+
+        handler = main.RenderHandler(cmd_args())
+        handler.index_templates()
+        results['cold_render'] = timed(lambda: render_all(handler))
+
+        handler.render_cache = RenderCache()
+        handler.layouts.clear()
+        results['warm_render'] = timed(lambda: render_all(handler))
+
+        partial = partial_path(here, 0)
+        results['partial_change'] = timed(
+            lambda: render_changed(handler, partial))
+
+        stylesheet = stylesheet_path(root, 0)
+        results['css_change'] = timed(
+            lambda: render_changed(handler, stylesheet))
+
+        for src_path in dev_templates(here, '_dev'):
+            os.remove(JsonGenerator.fixture_path(src_path))
+        live_premailer = main.LivePremailer()
+        live_premailer.args = cmd_args(jobs=args.jobs)
+
+        def init():
+            live_premailer.generate_json()
+            return args.templates
+        results['init'] = timed(init)
+        results['init_again'] = timed(init)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    return results
+
+
+def report(results, baseline=None):
+    for scenario in SCENARIOS:
+        result = results[scenario]
+        line = '{:>15}: {:9.1f}ms  {:5} templates'.format(
+            scenario, result['seconds'] * 1000, result['templates'])
+        if baseline and scenario in baseline:
+            before = baseline[scenario]['seconds']
+            line += '  {:6.2f}x vs baseline'.format(
+                before / max(result['seconds'], 1e-9))
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--templates', type=int, default=100)
+    parser.add_argument('--partials', type=int, default=20)
+    parser.add_argument('--stylesheets', type=int, default=4)
+    parser.add_argument('--rules', type=int, default=500,
+                        help='Rules per stylesheet')
+    parser.add_argument('--fixture-size', type=int, default=20)
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Processes generating json fixtures')
+    parser.add_argument('--output', help='Save results to this json file')
+    parser.add_argument('--compare', help='Json file of an earlier run')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    report(results, baseline)
+    if args.output:
+        params = vars(args).copy()
+        del params['output'], params['compare']
+        data = {
+            'params': params,
+            'python': platform.python_version(),
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Synthetic template trees shaped like examples/mybigproject.
+
+::
+
+    root
+    ├── static/css/mail_<k>.css
+    └── templates/mail
+        ├── partials/_header_<k>.html, _partial_<m>.html
+        └── group_<g>/template_<n>_dev.html, template_<n>_dev.json
+
+Every dev template includes one header (which links one stylesheet) and
+a few shared partials, and renders a fixture of ``fixture_size`` fields.
+"""
+import json
+import os
+
+
+TEMPLATES_PER_GROUP = 20
+PARTIALS_PER_TEMPLATE = 3
+
+RULE = '.rule-{0} td.cell-{0} {{ color: #{0:06x}; padding: {1}px; }}\n'
+
+HEADER = """{{% raw %}}
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional //EN" \
+"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html>
+<head>
+    <meta http-equiv="Content-Type" content="text/html; charset=UTF-8"/>
+    <link rel="stylesheet" href="../../static/css/mail_{stylesheet}.css"/>
+</head>
+<body>
+<table class="container">
+    <tr class="header"><td class="logo">
+        <img src="{{{{ request.static_url('static/img/logo.png') }}}}">
+    </td></tr>
+{{% endraw %}}
+"""
+
+PARTIAL = """{{% raw %}}
+<tr><td class="rule-{index} cell-{index}">Partial {index}</td></tr>
+{{% endraw %}}
+"""
+
+TEMPLATE = """{{% include 'partials/_header_{stylesheet}.html' %}}
+{includes}
+{{% raw %}}
+<tr><td class="main-content">
+{fields}
+    <table>
+    {{% for item in items %}}
+        <tr><td class="rule-1">{{{{ item.name }}}}</td></tr>
+    {{% endfor %}}
+    </table>
+</td></tr>
+</table>
+</body>
+</html>
+{{% endraw %}}
+"""
+
+
+def write(filepath, content):
+    directory = os.path.dirname(filepath)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(filepath, 'w') as f:
+        f.write(content)
+
+
+def stylesheet_path(root, index):
+    return os.path.join(root, 'static', 'css', 'mail_{}.css'.format(index))
+
+
+def partial_path(templates, index):
+    filename = '_partial_{}.html'.format(index)
+    return os.path.join(templates, 'partials', filename)
+
+
+def generate_tree(root, templates=100, partials=20, stylesheets=4,
+                  rules=500, fixture_size=20):
+    """Writes the tree and returns the directory to run lpremailer in."""
+    mail = os.path.join(root, 'templates', 'mail')
+    for index in range(stylesheets):
+        css = ''.join(RULE.format(rule, rule % 20) for rule in range(rules))
+        write(stylesheet_path(root, index), css)
+        filename = '_header_{}.html'.format(index)
+        write(os.path.join(mail, 'partials', filename),
+              HEADER.format(stylesheet=index))
+    for index in range(partials):
+        write(partial_path(mail, index), PARTIAL.format(index=index))
+
+    fields = '\n'.join('<p class="rule-{0}">{{{{ field_{0} }}}}</p>'
+                       .format(index) for index in range(fixture_size))
+    for index in range(templates):
+        includes = '\n'.join(
+            "{{% include 'partials/_partial_{}.html' %}}"
+            .format((index + offset) % partials)
+            for offset in range(min(PARTIALS_PER_TEMPLATE, partials)))
+        group = 'group_{}'.format(index // TEMPLATES_PER_GROUP)
+        basename = 'template_{}_dev'.format(index)
+        filepath = os.path.join(mail, group, basename)
+        write(filepath + '.html', TEMPLATE.format(
+            stylesheet=index % stylesheets, includes=includes,
+            fields=fields))
+        fixture = {
+            'request': {'static_url': 'lambda x: "/{}".format(x)'},
+            'items': [{'name': 'item {}'.format(item)}
+                      for item in range(fixture_size)],
+        }
+        for field in range(fixture_size):
+            fixture['field_{}'.format(field)] = 'value {}'.format(field)
+        write(filepath + '.json', json.dumps(fixture, indent=4))
+    return mail
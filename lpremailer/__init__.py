@@ -1,4 +1,5 @@
 from .main import RenderHandler
+from .renderer import Renderer
 from .utils import JsonGenerator
 
 
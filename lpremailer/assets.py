@@ -0,0 +1,144 @@
+import base64
+import collections
+import mimetypes
+import os
+import re
+
+from .cache import (RENDER_CACHE_MAXBYTES, LRUCache, RenderCache,
+                    content_hash)
+
+
+ASSETS_CACHE_SIZE = 1000
+INLINE_LIMIT = 4096
+FINGERPRINT_LENGTH = 12
+IMAGE_EXTENSIONS = ('.gif', '.jpeg', '.jpg', '.png', '.svg', '.webp')
+
+SRC_RE = re.compile(r'''(\b(?:src|background)\s*=\s*(["']))(.*?)(\2)''',
+                    re.IGNORECASE)
+CSS_URL_RE = re.compile(r'''(\burl\(\s*(&quot;|&#39;|["']?))(.*?)(\2\s*\))''',
+                        re.IGNORECASE)
+SCHEME_RE = re.compile(r'^(?:[a-zA-Z][a-zA-Z0-9+.-]*:|//)')
+# a jinja2 call with a single path, {{ request.static_url('img/logo.png') }}
+EXPRESSION_RE = re.compile(
+    r'''^\{\{\s*[\w.]+\(\s*(["'])([^"'{}]+)\1\s*\)\s*\}\}$''')
+
+Asset = collections.namedtuple('Asset', ['digest', 'size', 'uri'])
+
+
+def local_image(url):
+    if SCHEME_RE.match(url) or '{' in url:
+        return False
+    path = url.split('?', 1)[0].split('#', 1)[0]
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def fingerprint(url, digest):
+    """Adds (or replaces) a ``v`` query parameter with the digest."""
+    path, _, query = url.partition('?')
+    params = [param for param in query.split('&')
+              if param and not param.startswith('v=')]
+    params.append('v={}'.format(digest[:FINGERPRINT_LENGTH]))
+    return '{}?{}'.format(path, '&'.join(params))
+
+
+class AssetCache():
+    """Digests and data uris of images used by templates.
+
+    An entry is keyed by the image's path, modification time and size, so
+    every image is read, hashed and base64 encoded once until it changes.
+    Only images up to ``inline_limit`` bytes get a data uri. Entries are
+    kept in memory and, with ``directory``, on disk between runs, where
+    least recently used ones are evicted like rendered outputs are.
+    """
+
+    def __init__(self, directory=None, inline_limit=INLINE_LIMIT,
+                 maxsize=ASSETS_CACHE_SIZE, maxbytes=None):
+        self.inline_limit = inline_limit
+        self.assets = LRUCache(maxsize, maxbytes)
+        self.disk = None
+        if directory:
+            self.disk = RenderCache(directory,
+                                    maxbytes or RENDER_CACHE_MAXBYTES)
+
+    def key(self, filepath, stat):
+        return content_hash('{}\0{}\0{}'.format(filepath, stat.st_mtime,
+                                                stat.st_size))
+
+    def get(self, filepath):
+        stat = os.stat(filepath)
+        key = self.key(filepath, stat)
+        asset = self.assets.get(key)
+        if asset is None:
+            asset = self.load(key)
+        if asset is None or \
+                asset.uri is None and asset.size <= self.inline_limit:
+            asset = self.create(filepath)
+            self.store(key, asset)
+        if key not in self.assets:
+            self.assets.set(key, asset)
+        return asset
+
+    def state(self, filepath):
+        """Same as ``utils.file_state``, without reading the image again."""
+        try:
+            stat = os.stat(filepath)
+            asset = self.get(filepath)
+        except EnvironmentError:
+            return None
+        return [stat.st_mtime, stat.st_size, asset.digest]
+
+    def create(self, filepath):
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        uri = None
+        if len(data) <= self.inline_limit:
+            mimetype = mimetypes.guess_type(filepath)[0] or \
+                'application/octet-stream'
+            uri = 'data:{};base64,{}'.format(
+                mimetype, base64.b64encode(data).decode('ascii'))
+        return Asset(content_hash(data), len(data), uri)
+
+    def load(self, key):
+        if self.disk is None:
+            return None
+        entry = self.disk.get(key)
+        try:
+            return Asset(*entry)
+        except TypeError:
+            return None
+
+    def store(self, key, asset):
+        if self.disk is not None:
+            self.disk.set(key, tuple(asset))
+
+    def rewrite(self, html, resolve):
+        """Inlines small local images of ``html`` and fingerprints others.
+
+        ``resolve`` maps an url to the image file or None, when it isn't
+        found the url is left alone. An url made by a jinja2 call with a
+        single path, like ``{{ request.static_url('img/logo.png') }}``,
+        is resolved by that path; its fingerprint is added after the call.
+        Returns the html and the set of image files it uses.
+        """
+        filepaths = set()
+
+        def replace(match):
+            url = match.group(3)
+            expression = EXPRESSION_RE.match(url)
+            path = expression.group(2) if expression else url
+            if not local_image(path):
+                return match.group(0)
+            filepath = resolve(path.split('?', 1)[0].split('#', 1)[0])
+            if filepath is None:
+                return match.group(0)
+            filepaths.add(filepath)
+            asset = self.get(filepath)
+            if asset.uri:
+                url = asset.uri
+            elif expression:
+                url = '{}?v={}'.format(url, asset.digest[:FINGERPRINT_LENGTH])
+            else:
+                url = fingerprint(url, asset.digest)
+            return '{}{}{}'.format(match.group(1), url, match.group(4))
+        html = SRC_RE.sub(replace, html)
+        return CSS_URL_RE.sub(replace, html), filepaths
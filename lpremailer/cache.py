@@ -0,0 +1,234 @@
+import collections
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import threading
+
+
+RENDER_CACHE_MAXBYTES = 64 * 1024 * 1024
+
+
+def content_hash(text):
+    if not isinstance(text, bytes):
+        text = text.encode('utf8')
+    return hashlib.sha1(text).hexdigest()
+
+
+def sizeof(value):
+    """Approximate number of bytes held by ``value``.
+
+    Strings, bytes and containers of them are measured with everything
+    they hold, any other object only by itself.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sizeof(key) + sizeof(item) for key, item in value.items())
+    elif isinstance(value, (tuple, list, set, frozenset)):
+        size += sum(sizeof(item) for item in value)
+    return size
+
+
+def cache_stats(entries, size, hits, misses):
+    return collections.OrderedDict([
+        ('entries', entries),
+        ('bytes', size),
+        ('hits', hits),
+        ('misses', misses),
+    ])
+
+
+class LRUCache():
+    """Small thread safe mapping forgetting least recently used entries.
+
+    Entries are evicted once there are more than ``maxsize`` of them or,
+    with ``maxbytes``, once their approximate size exceeds it.
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.entries = collections.OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value, size=None):
+        """Stores ``value``, ``size`` is measured with ``sizeof`` if None."""
+        size = sizeof(value) if size is None else size
+        with self.lock:
+            self.discard(key)
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.size += size
+            while len(self.entries) > self.maxsize or \
+                    self.maxbytes is not None and self.size > self.maxbytes:
+                self.discard(next(iter(self.entries)))
+
+    def pop(self, key, default=None):
+        with self.lock:
+            value = self.entries.get(key, default)
+            self.discard(key)
+            return value
+
+    def discard(self, key):
+        if key in self.entries:
+            del self.entries[key]
+            self.size -= self.sizes.pop(key)
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return cache_stats(len(self.entries), self.size, self.hits,
+                               self.misses)
+
+
+class TemplateCache(LRUCache):
+    """LRUCache which can be the template cache of a jinja2 Environment.
+
+    A template is measured by the size of its source file.
+    """
+
+    def __setitem__(self, key, template):
+        try:
+            size = os.path.getsize(template.filename)
+        except (TypeError, EnvironmentError):
+            size = 0
+        self.set(key, template, size)
+
+
+class RenderCache():
+    """Rendered outputs addressed by a hash of everything they depend on.
+
+    An entry is any value ``marshal`` can store.
+
+    Entries are kept in ``directory`` so they survive restarts, or in
+    memory when no directory is given. Least recently used entries are
+    evicted once their total size exceeds ``maxbytes``.
+    """
+
+    TMP_SUFFIX = '.tmp'
+
+    def __init__(self, directory=None, maxbytes=RENDER_CACHE_MAXBYTES):
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.sizes = collections.OrderedDict()
+        self.entries = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self.load()
+
+    def __contains__(self, key):
+        return key in self.sizes
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def filepath(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self):
+        found = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(self.TMP_SUFFIX):
+                continue
+            stat = os.stat(self.filepath(filename))
+            found.append((stat.st_mtime, filename, stat.st_size))
+        for mtime, key, size in sorted(found):
+            self.sizes[key] = size
+            self.size += size
+
+    def get(self, key, valid=None):
+        """The entry of ``key``, None when it's missing or not ``valid``."""
+        with self.lock:
+            if key not in self.sizes:
+                self.misses += 1
+                return None
+            if not self.directory:
+                entry = self.entries[key]
+            else:
+                filepath = self.filepath(key)
+                try:
+                    with open(filepath, 'rb') as f:
+                        entry = marshal.load(f)
+                    os.utime(filepath, None)
+                except (EnvironmentError, EOFError, ValueError, TypeError):
+                    self.discard(key)
+                    self.misses += 1
+                    return None
+            if valid is not None and not valid(entry):
+                self.discard(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.sizes[key] = self.sizes.pop(key)
+            return entry
+
+    def set(self, key, entry):
+        data = marshal.dumps(entry)
+        with self.lock:
+            self.discard(key)
+            if self.directory:
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=self.directory, suffix=self.TMP_SUFFIX)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.filepath(key))
+            else:
+                self.entries[key] = entry
+            self.sizes[key] = len(data)
+            self.size += len(data)
+            self.evict()
+
+    def discard(self, key):
+        with self.lock:
+            size = self.sizes.pop(key, None)
+            if size is None:
+                return
+            self.size -= size
+            self.entries.pop(key, None)
+            if self.directory:
+                try:
+                    os.remove(self.filepath(key))
+                except OSError:
+                    pass
+
+    def evict(self):
+        while self.size > self.maxbytes and self.sizes:
+            self.discard(next(iter(self.sizes)))
+
+    def stats(self):
+        with self.lock:
+            return cache_stats(len(self.sizes), self.size, self.hits,
+                               self.misses)
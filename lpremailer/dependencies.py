@@ -0,0 +1,123 @@
+import os
+import re
+import threading
+
+from .utils import IGNORE_PATTERNS, dev_templates
+
+
+LINK_RE = re.compile(r'<link\b[^>]*>', re.IGNORECASE)
+ATTR_RE = re.compile(r'''(\w+)\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+REMOTE_PREFIXES = ('http://', 'https://', '//')
+
+
+def stylesheets(html):
+    for link in LINK_RE.findall(html):
+        attrs = {}
+        for name, dquoted, squoted in ATTR_RE.findall(link):
+            attrs[name.lower()] = dquoted or squoted
+        rel = attrs.get('rel', '').lower().split()
+        href = attrs.get('href')
+        if 'stylesheet' in rel and href and \
+                not href.startswith(REMOTE_PREFIXES):
+            yield href
+
+
+class DependencyIndex():
+    """Maps partials and stylesheets to the dev templates using them.
+
+    Every known file keeps the set of files it references directly:
+    templates from ``{% include %}``, ``{% extends %}`` and ``{% import %}``
+    and stylesheets linked in its static html. Names are resolved the way
+    the jinja2 loader and premailer do it, relatively to ``root``.
+    The index is safe to use from many threads.
+    """
+
+    def __init__(self, j2_env, root):
+        self.j2_env = j2_env
+        self.root = root
+        self.templates = set()
+        self.references = {}
+        self.referrers = {}
+        self.lock = threading.RLock()
+
+    def resolve(self, name):
+        return os.path.normpath(os.path.join(self.root, name))
+
+    def parse(self, filepath):
+        from jinja2 import meta, nodes
+        from jinja2.exceptions import TemplateSyntaxError
+        try:
+            with open(filepath, 'rb') as f:
+                source = f.read().decode('utf8')
+            parsed = self.j2_env.parse(source)
+        except (EnvironmentError, TemplateSyntaxError, UnicodeDecodeError):
+            return set()
+        references = set()
+        for name in meta.find_referenced_templates(parsed):
+            if name:
+                references.add(self.resolve(name))
+        for node in parsed.find_all(nodes.TemplateData):
+            for href in stylesheets(node.data):
+                references.add(self.resolve(href))
+        return references
+
+    def update(self, filepath):
+        filepath = os.path.abspath(filepath)
+        references = self.parse(filepath)
+        with self.lock:
+            for reference in self.references.get(filepath, ()):
+                self.referrers.get(reference, set()).discard(filepath)
+            self.references[filepath] = references
+            for reference in references:
+                self.referrers.setdefault(reference, set()).add(filepath)
+                if reference not in self.references and \
+                        not reference.endswith('.css'):
+                    self.update(reference)
+
+    def add(self, template):
+        template = os.path.abspath(template)
+        with self.lock:
+            self.templates.add(template)
+            self.update(template)
+
+    def discard(self, template):
+        with self.lock:
+            self.templates.discard(os.path.abspath(template))
+
+    def scan(self, top, devpostfix, ignore=IGNORE_PATTERNS):
+        for template in dev_templates(top, devpostfix, ignore):
+            self.add(template)
+
+    def dependencies(self, template):
+        found = set()
+        pending = [os.path.abspath(template)]
+        with self.lock:
+            while pending:
+                for reference in self.references.get(pending.pop(), ()):
+                    if reference not in found:
+                        found.add(reference)
+                        pending.append(reference)
+        return found
+
+    def dependents(self, filepath):
+        filepath = os.path.abspath(filepath)
+        found = set()
+        seen = {filepath}
+        pending = [filepath]
+        with self.lock:
+            while pending:
+                current = pending.pop()
+                if current in self.templates:
+                    found.add(current)
+                for referrer in self.referrers.get(current, ()):
+                    if referrer not in seen:
+                        seen.add(referrer)
+                        pending.append(referrer)
+        return found
+
+    def changed(self, filepath):
+        filepath = os.path.abspath(filepath)
+        with self.lock:
+            if filepath in self.references:
+                self.update(filepath)
+            return self.dependents(filepath)
@@ -0,0 +1,126 @@
+import functools
+import re
+
+from lxml import etree
+
+
+ENTITY_RE = re.compile(r'&(#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);')
+PLACEHOLDER = 0xF0000
+PLACEHOLDERS = 0xFFFFE - PLACEHOLDER
+PLACEHOLDER_RE = re.compile(u'[\U000F0000-\U000FFFFD]')
+RAW_TAGS = frozenset(['script', 'style'])
+DECODED_CACHE_SIZE = 4096
+
+
+def text_maker():
+    import html2text
+    maker = html2text.HTML2Text()
+    maker.ignore_images = True
+    return maker
+
+
+def parse(html):
+    return etree.fromstring(html, etree.HTMLParser()).getroottree()
+
+
+@functools.lru_cache(maxsize=DECODED_CACHE_SIZE)
+def decoded(ref):
+    """Text lxml makes of an entity reference."""
+    body = parse('<html><body><p>{}</p></body></html>'.format(ref))
+    return body.getroot()[0][0].text or ''
+
+
+class Document():
+    """Html of a render parsed once with lxml.
+
+    Stages read the parsed tree instead of parsing the html again:
+    ``text`` hands its serialization to html2text and premailer inlines
+    css straight into it. The html is parsed and serialized the way
+    premailer does it for a string, so outputs are the same as from
+    separate parses.
+
+    html2text renders entity references differently from the characters
+    they stand for (``&copy;`` becomes ``(C)``), so with ``entities`` set
+    every distinct reference is parsed as a placeholder character.
+    ``text`` serializes them as references and then puts decoded characters
+    back in place, before the tree is handed to any other stage. Html
+    which already holds placeholder characters, or more distinct
+    references than there are placeholders, is parsed as it is and
+    html2text parses it separately.
+    """
+
+    def __init__(self, html, entities=False):
+        stripped = html.strip()
+        self.refs = []
+        self.markers = {}
+        self.html = None
+        if entities and not PLACEHOLDER_RE.search(stripped):
+            marked = ENTITY_RE.sub(self.placeholder, stripped)
+            if len(self.refs) <= PLACEHOLDERS:
+                stripped = marked
+            else:
+                self.refs, self.markers = [], {}
+                self.html = stripped
+        elif entities:
+            self.html = stripped
+        self.tree = parse(stripped)
+        self.doctype = stripped.startswith(self.tree.docinfo.doctype)
+
+    @property
+    def root(self):
+        return self.tree.getroot()
+
+    def placeholder(self, match):
+        ref = match.group(0)
+        index = self.markers.get(ref)
+        if index is None:
+            index = self.markers[ref] = len(self.refs)
+            self.refs.append(ref)
+        return chr(PLACEHOLDER + index) if index < PLACEHOLDERS else ''
+
+    def ref(self, char):
+        return self.refs[ord(char) - PLACEHOLDER]
+
+    def serialize(self):
+        node = self.tree if self.doctype else self.root
+        return etree.tostring(node, method='html',
+                              encoding='utf-8').decode('utf-8')
+
+    def text(self, text_maker):
+        """Converts the tree with a ``html2text.HTML2Text`` instance."""
+        if self.html is not None:
+            return text_maker.handle(self.html)
+        self.restore(texts=False)
+        html = self.raw(self.serialize())
+        self.restore()
+        return text_maker.handle(html)
+
+    def raw(self, text):
+        return PLACEHOLDER_RE.sub(lambda match: self.ref(match.group(0)),
+                                  text)
+
+    def restore(self, texts=True):
+        """Puts decoded characters back in place of placeholders.
+
+        Without ``texts`` only attribute values are restored.
+        """
+        if not self.refs:
+            return
+
+        def decode(match):
+            return decoded(self.ref(match.group(0)))
+        for element in self.root.iter():
+            for name, value in element.items():
+                element.set(name, PLACEHOLDER_RE.sub(decode, value))
+            if not texts:
+                continue
+            raw = not isinstance(element.tag, str) or element.tag in RAW_TAGS
+            if element.text:
+                if raw:
+                    element.text = self.raw(element.text)
+                else:
+                    element.text = PLACEHOLDER_RE.sub(decode, element.text)
+            if element.tail:
+                element.tail = PLACEHOLDER_RE.sub(decode, element.tail)
+        if texts:
+            self.refs, self.markers = [], {}
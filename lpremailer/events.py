@@ -0,0 +1,11 @@
+import collections
+
+
+OUTPUTS = 'outputs'
+
+Change = collections.namedtuple('Change', ['kind', 'filepaths'])
+Change.__doc__ = """Files announced by RenderHandler to its listeners.
+
+``kind`` is ``OUTPUTS`` for files written by a render (only those whose
+content really changed).
+"""
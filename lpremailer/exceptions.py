@@ -1,10 +1,6 @@
+import functools
 import logging
 
-import six
-from jinja2.exceptions import (
-    TemplateNotFound, TemplateSyntaxError, UndefinedError)
-from premailer.premailer import ExternalFileLoadingError, ExternalNotFoundError
-
 
 logging.basicConfig(level=logging.INFO)
 
@@ -96,21 +92,30 @@ class LiveJSONDecodeError(LiveBaseError):
                           self.e.colno, self.e.pos)
 
 
-ERRORS = {
-    AttributeError: LiveAttributeError,
-    ExternalNotFoundError: LiveExternalNotFoundError,
-    ExternalFileLoadingError: LiveExternalNotFoundError,
-    TemplateNotFound: LiveTemplateNotFound,
-    TemplateSyntaxError: LiveTemplateSyntaxError,
-    TypeError: LiveTypeError,
-    UndefinedError: LiveUndefinedError,
-    UnicodeDecodeError: LiveUnicodeDecodeError,
-    UnicodeEncodeError: LiveUnicodeEncodeError,
-    ValueError: LiveValueError,
-}
-if six.PY3:
-    try:
-        from json.decoder import JSONDecodeError
-        ERRORS[JSONDecodeError] = LiveJSONDecodeError
-    except ImportError:
-        pass
+@functools.lru_cache(maxsize=None)
+def errors():
+    """Maps exceptions to their Live errors.
+
+    Built on first failure, so jinja2 and premailer aren't imported
+    before a template is rendered.
+    """
+    from jinja2.exceptions import (
+        TemplateNotFound, TemplateSyntaxError, UndefinedError)
+    from premailer.premailer import (
+        ExternalFileLoadingError, ExternalNotFoundError)
+
+    mapping = {
+        AttributeError: LiveAttributeError,
+        ExternalNotFoundError: LiveExternalNotFoundError,
+        ExternalFileLoadingError: LiveExternalNotFoundError,
+        TemplateNotFound: LiveTemplateNotFound,
+        TemplateSyntaxError: LiveTemplateSyntaxError,
+        TypeError: LiveTypeError,
+        UndefinedError: LiveUndefinedError,
+        UnicodeDecodeError: LiveUnicodeDecodeError,
+        UnicodeEncodeError: LiveUnicodeEncodeError,
+        ValueError: LiveValueError,
+    }
+    from json.decoder import JSONDecodeError
+    mapping[JSONDecodeError] = LiveJSONDecodeError
+    return mapping
@@ -0,0 +1,90 @@
+import os
+
+from premailer import Premailer
+
+from .cache import LRUCache
+from .document import Document
+
+
+STYLESHEETS_CACHE_SIZE = 64
+REMOTE_PREFIXES = ('http://', 'https://', '//')
+
+
+class StylesheetCache():
+    """Stylesheets read from disk and their parsed rules.
+
+    Sources are kept per resolved path and validated with the file's
+    modification time and size. Parsed rules are keyed by the source
+    itself, so they are shared by every template using the stylesheet;
+    a cached source is always the same string object, which makes the
+    lookup cheap however large the stylesheet is. ``maxbytes`` is shared
+    evenly by sources and rules.
+    """
+
+    def __init__(self, maxsize=STYLESHEETS_CACHE_SIZE, maxbytes=None):
+        half = maxbytes // 2 if maxbytes is not None else None
+        self.sources = LRUCache(maxsize, half)
+        self.rules = LRUCache(maxsize * 4, half)
+
+    def source(self, filepath):
+        stat = os.stat(filepath)
+        version = (stat.st_mtime, stat.st_size)
+        cached = self.sources.get(filepath)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with open(filepath, 'rb') as f:
+            css_body = f.read().decode('utf8')
+        self.sources.set(filepath, (version, css_body))
+        return css_body
+
+    def invalidate(self, filepath):
+        cached = self.sources.pop(os.path.abspath(filepath))
+        if cached is None:
+            return
+        for key in self.rules.keys():
+            if key[0] is cached[1]:
+                self.rules.pop(key)
+
+
+class CachedPremailer(Premailer):
+    """Premailer reading and parsing local stylesheets through a cache.
+
+    A local stylesheet not found relatively to ``base_path`` is looked
+    up in ``static_dir``, if given.
+    """
+
+    def __init__(self, stylesheets, static_dir=None, **kwargs):
+        super(CachedPremailer, self).__init__(**kwargs)
+        self.stylesheets = stylesheets
+        self.static_dir = static_dir
+
+    def _load_external(self, url):
+        local = self.allow_loading_external_files and \
+            not url.startswith(REMOTE_PREFIXES)
+        if local:
+            base_path = os.path.abspath(self.base_path or os.curdir)
+            stylefile = os.path.abspath(os.path.join(base_path, url))
+            if not os.path.exists(stylefile) and self.static_dir:
+                stylefile = os.path.join(self.static_dir, url.lstrip('/'))
+            if os.path.exists(stylefile):
+                return self.stylesheets.source(stylefile)
+        return super(CachedPremailer, self)._load_external(url)
+
+    def _parse_style_rules(self, css_body, ruleset_index):
+        key = (css_body, ruleset_index)
+        parsed = self.stylesheets.rules.get(key)
+        if parsed is None:
+            parsed = super(CachedPremailer, self)._parse_style_rules(
+                css_body, ruleset_index)
+            self.stylesheets.rules.set(key, parsed)
+        return parsed
+
+
+def transform(html, stylesheets, **kwargs):
+    """Inlines css of a html string or of a Document, in place."""
+    premailer = CachedPremailer(stylesheets, **kwargs)
+    if isinstance(html, Document):
+        html.restore()
+        premailer.transform(html.root)
+        return html.serialize()
+    return premailer.transform(html, pretty_print=False)
@@ -0,0 +1,71 @@
+import collections
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RenderJob():
+    """State of a single render of a dev template.
+
+    ``generation`` tells which change of the template the job renders,
+    a job is stale once a newer change of the same template arrives.
+    A job with a ``locale`` renders the template in that language.
+    """
+
+    def __init__(self, src_path, generation=0, locale=None):
+        self.src_path = src_path
+        self.generation = generation
+        self.locale = locale
+        self.path = os.path.dirname(src_path)
+        filename = os.path.basename(src_path)
+        self.filebase, self.ext = os.path.splitext(filename)
+        self.data = None
+        self.html = None
+        self.document = None
+        self.inlined = None
+        self.text = None
+        self.assets = None
+        self.layout_key = None
+        self.outputs = collections.OrderedDict()
+
+
+class JobQueue():
+    """Runs ``func(key)`` on a pool of threads.
+
+    A key submitted again while its job is still waiting isn't queued
+    twice, and jobs for the same key never run at the same time.
+    """
+
+    def __init__(self, func, workers):
+        self.func = func
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.running = {}
+
+    def submit(self, key):
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                future = self.executor.submit(self.run, key)
+                self.pending[key] = future
+            return future
+
+    def run(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+            running = self.running.get(key)
+            if running is None:
+                running = self.running[key] = [threading.Lock(), 0]
+            running[1] += 1
+        try:
+            with running[0]:
+                return self.func(key)
+        finally:
+            with self.lock:
+                running[1] -= 1
+                if not running[1]:
+                    del self.running[key]
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
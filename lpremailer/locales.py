@@ -0,0 +1,12 @@
+import functools
+
+
+LOCALEDIR = 'locale'
+
+
+@functools.lru_cache(maxsize=None)
+def translations(locale=None, localedir=None):
+    from babel.support import Translations
+    if locale is None:
+        return Translations.load()
+    return Translations.load(localedir, [locale])
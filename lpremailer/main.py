@@ -1,32 +1,97 @@
 import argparse
+import cProfile
+import collections
+import functools
+import hashlib
 import logging
-import json
+import multiprocessing
 import os
+import signal
 import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-import html2text
-from babel.support import Translations
-from jinja2 import Environment, FileSystemLoader
-from premailer import transform
-from watchdog.observers.polling import PollingObserver
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import EVENT_TYPE_MOVED, FileSystemEventHandler
 
-from .exceptions import ERRORS, LiveBaseError
-from .utils import JsonGenerator, parse_params, unquote, object_hook
+from .assets import IMAGE_EXTENSIONS, INLINE_LIMIT, AssetCache
+from .cache import (LRUCache, RenderCache, TemplateCache, content_hash,
+                    sizeof)
+from .dependencies import DependencyIndex
+from .events import OUTPUTS, Change
+from .exceptions import LiveBaseError, errors
+from .jobs import JobQueue, RenderJob
+from .locales import LOCALEDIR, translations
+from .manifest import Manifest
+from .merge import BATCH_SIZE, MailMerge
+from .stats import (RenderStats, format_cache_stats, format_timings,
+                    format_size, milliseconds, resident_size)
+from .utils import (IGNORE_PATTERNS, FixtureCache, JsonGenerator,
+                    dev_templates, file_state, ignored, lambdas,
+                    parse_params, unquote, watches, write_if_changed)
 
 
 logging.basicConfig(level=logging.INFO)
-translations = Translations.load()
 
 HERE = os.getcwd()
 
 PARSER_INIT = 'init'
 PARSER_RUN = 'runserver'
+PARSER_BUILD = 'build'
+PARSER_MERGE = 'merge'
+
+SERVER_BSYNC = 'browsersync'
+SERVER_BUILTIN = 'builtin'
+# files in --staticdir which lpremailer watches itself
+BSYNC_EXCLUDED = ('.css', '.html', '.json', '.less', '.sass', '.scss')
 
 HISTORY_FILENAME = 'lpremailer.history'
 HISTORY_FILEPATH = '{}/{}'.format(HERE, HISTORY_FILENAME)
+MANIFEST_FILENAME = 'lpremailer.manifest'
+MANIFEST_FILEPATH = '{}/{}'.format(HERE, MANIFEST_FILENAME)
+
+TEMPLATES_CACHE_SIZE = 400
+LAYOUTS_CACHE_SIZE = 400
+ROLES_CACHE_SIZE = 10000
+
+MEGABYTE = 1024 * 1024
+CACHE_BUDGETS = collections.OrderedDict([
+    ('templates', 16),
+    ('livetemplates', 16),
+    ('layouts', 32),
+    ('fixtures', 16),
+    ('stylesheets', 16),
+    ('renders', 64),
+    ('roles', 1),
+    ('assets', 16),
+    ('lambdas', 1),
+])
+
+
+def ignore_patterns(cmd_args):
+    return IGNORE_PATTERNS + tuple(getattr(cmd_args, 'ignore', None) or ())
+
+
+def cache_budget(value):
+    """Parses a ``--cachebudget`` value, ``CACHE=MEGABYTES``."""
+    name, _, size = value.partition('=')
+    if name not in CACHE_BUDGETS:
+        msg = 'unknown cache {!r}, choose from {}'
+        raise argparse.ArgumentTypeError(
+            msg.format(name, ', '.join(CACHE_BUDGETS)))
+    try:
+        return name, float(size)
+    except ValueError:
+        msg = 'invalid number of megabytes {!r}'
+        raise argparse.ArgumentTypeError(msg.format(size))
+
+
+def cache_budgets(cmd_args):
+    budgets = dict(CACHE_BUDGETS)
+    budgets.update(getattr(cmd_args, 'cachebudget', None) or ())
+    return dict((name, int(size * MEGABYTE))
+                for name, size in budgets.items())
 
 
 class RenderHandler(FileSystemEventHandler):
@@ -34,70 +99,322 @@ class RenderHandler(FileSystemEventHandler):
     EXT_HTML = '.html'
     EXT_JSON = '.json'
     EXTENSIONS = (EXT_CSS, EXT_HTML, EXT_JSON)
+    ROLE_ASSET = 'asset'
+    ROLE_CSS = 'css'
+    ROLE_DEV = 'dev'
+    ROLE_FIXTURE = 'fixture'
+    ROLE_OUTPUT = 'output'
+    ROLE_PARTIAL = 'partial'
+    ROLE_TEMPLATE = 'template'
 
     def __init__(self, cmd_args):
         self.cmd_args = cmd_args
+        self._j2_env = None
+        self._dependencies = None
+        self._stylesheets = None
+        self.lazy_lock = threading.RLock()
         self.src_dir = HERE
+        self.src_path = None
         self.history = set()
         self.history_excluded = set()
-        if self.cmd_args.loadhistory:
-            self.load_history()
         self.devpostfix = self.cmd_args.devpostfix
         self.livepostfix = self.cmd_args.livepostfix
-        self.postfixes = (self.livepostfix, self.devpostfix)
-        self.j2_loader = FileSystemLoader('.')
-        self.j2_env = Environment(
-            loader=self.j2_loader, extensions=["jinja2.ext.i18n"])
-        self.j2_env.install_gettext_translations(translations)
-        self.text_maker = html2text.HTML2Text()
-        self.text_maker.ignore_images = True
+        self.cachedir = getattr(self.cmd_args, 'cachedir', None)
+        self.ignore = ignore_patterns(self.cmd_args)
+        self.include = tuple(getattr(self.cmd_args, 'include', None) or ())
+        self.budgets = cache_budgets(self.cmd_args)
+        self.roles = LRUCache(ROLES_CACHE_SIZE, self.budgets['roles'])
+        self.watch = None
+        locales = getattr(self.cmd_args, 'locales', None) or ''
+        self.locales = [locale for locale in locales.split(',') if locale]
+        self.localedir = getattr(self.cmd_args, 'localedir', None) or \
+            LOCALEDIR
+        self.environments = {}
+        self.environments_lock = threading.Lock()
+        self.templates = TemplateCache(TEMPLATES_CACHE_SIZE,
+                                       self.budgets['templates'])
+        self.live_templates = LRUCache(TEMPLATES_CACHE_SIZE,
+                                       self.budgets['livetemplates'])
+        lambdas.maxbytes = self.budgets['lambdas']
+        self.layouts = LRUCache(LAYOUTS_CACHE_SIZE, self.budgets['layouts'])
+        self.render_cache = RenderCache(self.cache_path('renders'),
+                                        self.budgets['renders'])
+        self.fixtures = FixtureCache(
+            restricted=getattr(self.cmd_args, 'restricted', False),
+            maxbytes=self.budgets['fixtures'])
+        self.manifest = Manifest(MANIFEST_FILEPATH, HERE)
+        self.assets = None
+        if getattr(self.cmd_args, 'assets', False):
+            self.assets = AssetCache(
+                self.cache_path('assets'),
+                getattr(self.cmd_args, 'inlinelimit', INLINE_LIMIT),
+                maxbytes=self.budgets['assets'])
+        self.asset_references = {}
+        if self.cmd_args.loadhistory:
+            self.load_history()
         self.funcs_sequence = [self.parse_json, self.prepare_html,
-                               self.premail, self.live_html]
+                               self.inline, self.premail, self.live_html]
         if self.cmd_args.astext:
-            self.funcs_sequence.append(self.html_to_txt)
+            self.funcs_sequence.insert(2, self.html_to_txt)
+        if self.assets:
+            self.funcs_sequence.insert(
+                self.funcs_sequence.index(self.premail), self.inline_assets)
+        self.locales_pool = None
+        if self.locales:
+            self.funcs_sequence = [self.parse_json, self.render_locales]
+            self.locales_pool = ThreadPoolExecutor(len(self.locales))
+        self.debounce = getattr(self.cmd_args, 'debounce', 0) / 1000.0
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+        self.targets_lock = threading.Lock()
+        self.timer = None
+        self.stats = RenderStats()
+        self.profiledir = getattr(self.cmd_args, 'profile', None)
+        self.profile_lock = threading.Lock()
+        self.generations = {}
+        self.generations_lock = threading.Lock()
+        self.listeners = []
+        workers = getattr(self.cmd_args, 'workers', 0)
+        self.queue = JobQueue(self.proceed, workers) if workers else None
 
-    def on_modified(self, event):
-        self.src_dir = HERE
+    @property
+    def j2_env(self):
+        if self._j2_env is None:
+            with self.lazy_lock:
+                if self._j2_env is None:
+                    self._j2_env = self.create_environment(translations())
+        return self._j2_env
+
+    def create_environment(self, translations):
+        from jinja2 import Environment, FileSystemLoader
+        j2_env = Environment(
+            loader=FileSystemLoader('.'), extensions=["jinja2.ext.i18n"],
+            cache_size=TEMPLATES_CACHE_SIZE, auto_reload=True,
+            bytecode_cache=self.bytecode_cache())
+        j2_env.install_gettext_translations(translations)
+        j2_env.cache = self.templates
+        return j2_env
+
+    def environment(self, locale=None):
+        if locale is None:
+            return self.j2_env
+        with self.environments_lock:
+            j2_env = self.environments.get(locale)
+            if j2_env is None:
+                j2_env = self.create_environment(
+                    translations(locale, self.localedir))
+                self.environments[locale] = j2_env
+        return j2_env
 
+    @property
+    def dependencies(self):
+        if self._dependencies is None:
+            with self.lazy_lock:
+                if self._dependencies is None:
+                    self._dependencies = DependencyIndex(self.j2_env, HERE)
+        return self._dependencies
+
+    @property
+    def stylesheets(self):
+        if self._stylesheets is None:
+            from .inliner import StylesheetCache
+            with self.lazy_lock:
+                if self._stylesheets is None:
+                    self._stylesheets = StylesheetCache(
+                        maxbytes=self.budgets['stylesheets'])
+        return self._stylesheets
+
+    def dispatch(self, event):
         if event.is_directory:
+            if event.event_type == EVENT_TYPE_MOVED:
+                self.watch_directory(event.dest_path)
+            super().dispatch(event)
             return
+        if event.event_type == EVENT_TYPE_MOVED:
+            src_path = event.dest_path
+        else:
+            src_path = event.src_path
+        if self.role(src_path) not in (None, self.ROLE_OUTPUT):
+            super().dispatch(event)
 
-        filebase, ext = self.filename_splitext(event.src_path)
-        if ext not in self.EXTENSIONS:
-            return
+    def on_created(self, event):
+        if event.is_directory:
+            self.watch_directory(event.src_path)
+        else:
+            self.schedule(event.src_path)
 
-        if ext != self.EXT_HTML:
-            if ext == self.EXT_JSON:
-                self.src_dir = os.path.dirname(event.src_path)
-                filename = '{}.html'.format(filebase)
-                src_path = self.absolute_path(filename)
-                self.proceed(src_path)
-                return
-            if ext == self.EXT_CSS:
-                self.history_proceed()
-                return
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.schedule(event.src_path)
 
-        if filebase.startswith('_'):
-            self.history_proceed()
-            return
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.schedule(event.dest_path)
 
-        root = self.filename_root(filebase)
-        filename = '{}{}'.format(root, self.devpostfix)
-        if filename in self.history:
-            return
+    def on_deleted(self, event):
+        if not event.is_directory and \
+                self.role(event.src_path) == self.ROLE_DEV:
+            self.forget(event.src_path)
+
+    def forget(self, src_path):
+        """Drops everything kept about a removed dev template."""
+        relpath = os.path.relpath(os.path.dirname(src_path), HERE)
+        filename = os.path.basename(src_path)
+        self.history.discard('{}/{}'.format(relpath, filename))
+        with self.generations_lock:
+            self.generations.pop(src_path, None)
+        self.stats.discard(src_path)
+        self.dependencies.discard(src_path)
+        self.roles.pop(src_path)
+        self.asset_references.pop(src_path, None)
+
+    def watch_directory(self, directory):
+        if self.watch and not self.excluded(directory, directory=True):
+            self.watch(directory)
+
+    def role(self, src_path):
+        """Tells what ``src_path`` is to renders, None if it's ignored.
+
+        Roles are worked out from a path once and kept, renders and
+        ``index_templates`` record outputs and dev templates up front.
+        """
+        role = self.roles.get(src_path, False)
+        if role is False:
+            role = self.path_role(src_path)
+            self.roles.set(src_path, role)
+        return role
 
+    def path_role(self, src_path):
+        filebase, ext = self.filename_splitext(src_path)
+        image = self.assets is not None and \
+            ext.lower() in IMAGE_EXTENSIONS
+        if ext not in self.EXTENSIONS and not image or \
+                self.excluded(src_path):
+            return None
+        if image:
+            return self.ROLE_ASSET
+        if ext == self.EXT_CSS:
+            return self.ROLE_CSS
+        if ext == self.EXT_JSON:
+            return self.ROLE_FIXTURE
+        if filebase.startswith('_'):
+            return self.ROLE_PARTIAL
         if filebase.endswith(self.devpostfix):
-            src_dir = os.path.dirname(event.src_path)
-            relpath = os.path.relpath(src_dir, HERE)
-            self.history.add('{}/{}{}'.format(relpath, filebase, ext))
+            return self.ROLE_DEV
+        if self.generated(src_path, filebase):
+            return self.ROLE_OUTPUT
+        return self.ROLE_TEMPLATE
+
+    def excluded(self, src_path, directory=False):
+        relpath = os.path.relpath(src_path, HERE)
+        if any(ignored(part, self.ignore) for part in relpath.split(os.sep)):
+            return True
+        if self.include and not directory:
+            return not ignored(relpath.replace(os.sep, '/'), self.include)
+        return False
 
-            self.proceed(event.src_path)
+    def generated(self, src_path, filebase):
+        for locale in self.locales:
+            suffix = '_{}'.format(locale)
+            if filebase.endswith(suffix):
+                filebase = filebase[:-len(suffix)]
+                break
+        if filebase.endswith(self.livepostfix):
+            return True
+        if filebase.endswith('_txt'):
+            filebase = filebase[:-len('_txt')]
+        filename = '{}{}.html'.format(filebase, self.devpostfix)
+        return os.path.exists(os.path.join(os.path.dirname(src_path),
+                                           filename))
+
+    def schedule(self, src_path):
+        if not self.debounce:
+            with self.targets_lock:
+                templates = self.targets(src_path)
+            self.render(templates)
             return
+        with self.pending_lock:
+            self.pending.add(src_path)
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.pending_lock:
+            pending, self.pending = self.pending, set()
+            self.timer = None
+        templates = set()
+        with self.targets_lock:
+            for src_path in sorted(pending):
+                templates.update(self.targets(src_path))
+        self.render(templates)
+
+    def render(self, templates):
+        for src_path in sorted(templates):
+            self.supersede(src_path)
+            if self.queue:
+                self.queue.submit(src_path)
+            else:
+                self.proceed(src_path)
+
+    def stop(self):
+        with self.pending_lock:
+            if self.timer:
+                self.timer.cancel()
+        if self.queue:
+            self.queue.shutdown()
+        if self.locales_pool:
+            self.locales_pool.shutdown()
+
+    def targets(self, src_path):
+        role = self.role(src_path)
+        if role == self.ROLE_FIXTURE:
+            filebase, ext = self.filename_splitext(src_path)
+            filename = '{}.html'.format(filebase)
+            return {os.path.join(os.path.dirname(src_path), filename)}
+
+        if role == self.ROLE_CSS:
+            self.stylesheets.invalidate(src_path)
+            return self.dependencies.changed(src_path)
+
+        if role in (self.ROLE_PARTIAL, self.ROLE_TEMPLATE):
+            return self.dependencies.changed(src_path)
+
+        if role == self.ROLE_ASSET:
+            filepath = os.path.abspath(src_path)
+            return set(template for template, filepaths
+                       in list(self.asset_references.items())
+                       if filepath in filepaths)
+
+        if role == self.ROLE_DEV:
+            relpath = os.path.relpath(os.path.dirname(src_path), HERE)
+            filename = os.path.basename(src_path)
+            self.history.add('{}/{}'.format(relpath, filename))
+            self.dependencies.add(src_path)
+            return {src_path}
+        return set()
 
     def history_proceed(self):
-        for filename in self.history:
-            src_path = self.absolute_path(filename)
-            self.proceed(src_path)
+        self.render(self.absolute_path(filename) for filename in self.history)
+
+    def index_templates(self):
+        self.dependencies.scan(HERE, self.devpostfix, self.ignore)
+        for src_path in sorted(self.dependencies.templates):
+            self.role(src_path)
+
+    def warm_start(self):
+        templates = [self.absolute_path(filename)
+                     for filename in sorted(self.history)]
+        options = self.render_options()
+        outdated = [src_path for src_path in templates
+                    if self.manifest.outdated(src_path, options)]
+        msg = '\n{} of {} templates from {} are out of date{}\n{}'
+        msg = msg.format(len(outdated), len(templates), HISTORY_FILENAME,
+                         ':' if outdated else '.', '\n'.join(outdated))
+        logging.info(msg)
+        self.render(outdated)
 
     def load_history(self):
         if not os.path.exists(HISTORY_FILEPATH):
@@ -114,6 +431,7 @@ class RenderHandler(FileSystemEventHandler):
                 filepath = self.absolute_path(filename)
                 if os.path.exists(filepath):
                     self.history.add(filename)
+                    self.dependencies.add(filepath)
                 else:
                     missing.add(filepath)
         if missing:
@@ -125,6 +443,7 @@ class RenderHandler(FileSystemEventHandler):
             msg = '\n\nFollowing filenames from {} loaded:\n{}\n'
             msg = msg.format(HISTORY_FILENAME, filenames)
             logging.info(msg)
+        self.manifest.load()
 
     def save_history(self):
         for filename in self.history:
@@ -139,84 +458,408 @@ class RenderHandler(FileSystemEventHandler):
         msg = '\nFollowing filenames saved into {}:\n{}'
         msg = msg.format(HISTORY_FILENAME, filenames)
         logging.info(msg)
+        self.manifest.save()
+
+    def cache_path(self, name):
+        if self.cachedir:
+            return os.path.join(self.cachedir, name)
+
+    def bytecode_cache(self):
+        from jinja2 import FileSystemBytecodeCache
+        directory = self.cache_path('bytecode')
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        return FileSystemBytecodeCache(directory)
 
     def absolute_path(self, filename):
         return '{}/{}'.format(self.src_dir, filename)
 
-    def filename_root(self, filename):
-        root = filename
-        for postfix in self.postfixes:
-            root = root.replace(postfix, '')
-        return root
+    def supersede(self, src_path):
+        with self.generations_lock:
+            generation = self.generations.get(src_path, 0) + 1
+            self.generations[src_path] = generation
+
+    def generation(self, src_path):
+        with self.generations_lock:
+            return self.generations.get(src_path, 0)
+
+    def superseded(self, job):
+        if self.generation(job.src_path) == job.generation:
+            return False
+        msg = '\n{}...superseded by a newer change'.format(job.src_path)
+        logging.debug(msg)
+        return True
 
     def proceed(self, src_path):
-        self.file_vars(src_path)
-        for func in self.funcs_sequence:
-            if not self.passed(func):
-                break
-        else:
-            msg = '\n{}...OK'.format(self.src_path)
+        if not self.profiledir:
+            return self.proceed_job(src_path)
+        with self.profile_lock:
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(self.proceed_job, src_path)
+            finally:
+                self.dump_profile(profile, src_path)
+
+    def dump_profile(self, profile, src_path):
+        os.makedirs(self.profiledir, exist_ok=True)
+        relpath = os.path.relpath(src_path, HERE)
+        name = os.path.splitext(relpath)[0].replace(os.sep, '_')
+        filename = '{}-{}.pstats'.format(name, int(time.time() * 1000))
+        profile.dump_stats(os.path.join(self.profiledir, filename))
+
+    def proceed_job(self, src_path):
+        job = RenderJob(src_path, self.generation(src_path))
+        inputs = self.render_inputs(job)
+        key = self.render_key(inputs)
+        cached = self.cached_render(key)
+        if cached is not None:
+            outputs, images = cached
+            job.outputs.update(outputs)
+            if not self.save(job):
+                return False
+            if images:
+                self.asset_references[job.src_path] = set(images)
+            self.asset_inputs(inputs, images)
+            self.manifest.record(job.src_path, inputs,
+                                 self.output_states(job),
+                                 self.render_options())
+            msg = '\n{}...OK (cached)'.format(job.src_path)
             logging.info(msg)
+            return True
+        job.layout_key = self.layout_key(job, inputs)
+        self.load_layout(job)
+        timings = collections.OrderedDict()
+        for func in self.funcs_sequence:
+            if self.superseded(job):
+                return False
+            start = time.time()
+            passed = self.passed(functools.partial(func, job), job.src_path)
+            timings[func.__name__] = time.time() - start
+            if not passed:
+                self.save(job)
+                return False
+        if not self.save(job):
+            return False
+        images = {}
+        if job.assets is not None:
+            self.asset_references[job.src_path] = job.assets
+            self.asset_inputs(inputs, job.assets)
+            images = dict((filepath, inputs[filepath][2])
+                          for filepath in job.assets if inputs[filepath])
+        self.store_layout(job)
+        self.render_cache.set(key, (dict(job.outputs), images))
+        self.manifest.record(job.src_path, inputs, self.output_states(job),
+                             self.render_options())
+        total = sum(timings.values())
+        self.stats.add(job.src_path, total)
+        msg = '\n{}...OK\n{}\ntotal {}, {}'
+        msg = msg.format(job.src_path, format_timings(timings),
+                         milliseconds(total), self.stats.format(job.src_path))
+        logging.info(msg)
+        return True
+
+    def cached_render(self, key):
+        """Outputs and image digests of a cached render.
 
-    def file_vars(self, src_path):
-        self.src_path = src_path
-        self.file_path()
-        self.filebase, self.ext = self.filename_splitext(self.src_path)
+        Images aren't part of the key until a render finds them, so their
+        digests are kept with the outputs and checked here.
+        """
+        def valid(entry):
+            if not isinstance(entry, tuple) or len(entry) != 2:
+                return False
+            for filepath, digest in entry[1].items():
+                state = self.assets.state(filepath) if self.assets else None
+                if state is None or state[2] != digest:
+                    return False
+            return True
+        return self.render_cache.get(key, valid)
 
-    def file_path(self):
-        self.path = os.path.dirname(self.src_path)
+    def asset_inputs(self, inputs, filepaths):
+        for filepath in sorted(filepaths):
+            if filepath not in inputs:
+                inputs[filepath] = self.assets.state(filepath)
+
+    def save(self, job):
+        written = []
+        with self.generations_lock:
+            if self.generations.get(job.src_path, 0) != job.generation:
+                return False
+            for filepath, content in job.outputs.items():
+                self.roles.set(filepath, self.ROLE_OUTPUT)
+                if write_if_changed(filepath, content):
+                    written.append(filepath)
+        if written:
+            self.announce(OUTPUTS, written)
+        return True
+
+    def cache_stats(self):
+        """Entries, approximate bytes, hits and misses of every cache."""
+        caches = collections.OrderedDict([
+            ('templates', self.templates),
+            ('livetemplates', self.live_templates),
+            ('layouts', self.layouts),
+            ('fixtures', self.fixtures.fixtures),
+            ('renders', self.render_cache),
+            ('roles', self.roles),
+            ('lambdas', lambdas),
+        ])
+        if self.assets:
+            caches['assets'] = self.assets.assets
+        if self._stylesheets is not None:
+            caches['stylesheets'] = self.stylesheets.sources
+            caches['stylesheet rules'] = self.stylesheets.rules
+        return collections.OrderedDict(
+            (name, cache.stats()) for name, cache in caches.items())
+
+    def log_cache_stats(self):
+        lines = [format_cache_stats(name, stats)
+                 for name, stats in self.cache_stats().items()]
+        size = resident_size()
+        lines.append('resident size {}'.format(
+            format_size(size) if size is not None else 'unknown'))
+        logging.info('\nCaches:\n{}'.format('\n'.join(lines)))
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def announce(self, kind, filepaths):
+        change = Change(kind, filepaths)
+        for listener in self.listeners:
+            listener(change)
+
+    def output_states(self, job):
+        states = {}
+        for filepath, content in job.outputs.items():
+            try:
+                stat = os.stat(filepath)
+            except EnvironmentError:
+                continue
+            states[filepath] = [stat.st_mtime, stat.st_size,
+                                content_hash(content)]
+        return states
+
+    def render_inputs(self, job):
+        if job.src_path not in self.dependencies.templates:
+            self.dependencies.add(job.src_path)
+        json_path = os.path.join(job.path, '{}.json'.format(job.filebase))
+        dependencies = sorted(self.dependencies.dependencies(job.src_path))
+        inputs = collections.OrderedDict()
+        for filepath in [job.src_path, json_path] + dependencies:
+            inputs[filepath] = file_state(filepath)
+        for filepath in sorted(self.asset_references.get(job.src_path, ())):
+            inputs[filepath] = self.assets.state(filepath)
+        for locale in self.locales:
+            for filepath in translations(locale, self.localedir).files:
+                inputs[filepath] = file_state(filepath)
+        return inputs
+
+    def render_options(self):
+        """Options which change outputs without changing any input file."""
+        staticdir = getattr(self.cmd_args, 'staticdir', None)
+        return (self.devpostfix, self.livepostfix,
+                bool(self.cmd_args.astext), self.locales,
+                self.assets and self.assets.inline_limit,
+                staticdir and os.path.abspath(staticdir),
+                bool(getattr(self.cmd_args, 'restricted', False)))
+
+    def render_key(self, inputs):
+        digest = hashlib.sha1(repr(self.render_options()).encode('utf8'))
+        for filepath, state in inputs.items():
+            digest.update(filepath.encode('utf8'))
+            digest.update(state[2].encode('utf8') if state else b'-')
+        return digest.hexdigest()
+
+    def layout_key(self, job, inputs):
+        """Key of what a template renders to before its json is applied.
+
+        Only the template, templates it depends on, stylesheets and
+        translations go into it, so an edited json file keeps the key.
+        """
+        json_path = os.path.join(job.path, '{}.json'.format(job.filebase))
+        layout_inputs = collections.OrderedDict(
+            (filepath, state) for filepath, state in inputs.items()
+            if filepath != json_path)
+        return self.render_key(layout_inputs)
+
+    def load_layout(self, job):
+        layout = self.layouts.get((job.layout_key, job.locale))
+        if layout is not None:
+            job.html, job.inlined, job.text, job.assets = layout
+
+    def store_layout(self, job):
+        if job.layout_key is not None and job.inlined is not None:
+            self.layouts.set((job.layout_key, job.locale),
+                             (job.html, job.inlined, job.text, job.assets))
+
+    def output(self, job, filepath, text):
+        if job.locale:
+            root, ext = os.path.splitext(filepath)
+            filepath = '{}_{}{}'.format(root, job.locale, ext)
+        job.outputs[filepath] = text.encode('utf8')
 
     def filename_splitext(self, src_path):
         filename = os.path.basename(src_path)
         return os.path.splitext(filename)
 
-    def passed(self, func):
+    def passed(self, func, src_path=None):
         try:
             func()
         except Exception as e:
-            ERRORS.get(type(e), LiveBaseError)(e, self.src_path).log()
+            src_path = src_path or self.src_path
+            errors().get(type(e), LiveBaseError)(e, src_path).log()
             return False
         return True
 
-    def parse_json(self):
-        json_filename = '{}.json'.format(self.filebase)
-        with open(os.path.join(self.path, json_filename), 'r') as fjson:
-            self.data = json.load(fjson, object_hook=object_hook)
-
-    def prepare_html(self):
-        filepath = os.path.join(self.path, '{}.html'.format(self.filebase))
-        with open(filepath, 'rb') as f:
-            data = f.read().decode('utf8')
-            template = self.j2_env.from_string(data)
-            self.html = template.render()
-
-    def premail(self):
-        filename = self.filebase.replace(self.devpostfix, '')
-        filepath = os.path.join(self.path, '{}.html'.format(filename))
-        transformed = transform(self.html, allow_loading_external_files=True)
-        unquoted = unquote(transformed)
-        encoded = unquoted.encode('utf8')
-        with open(filepath, 'wb+') as f:
-            f.write(encoded)
-
-    def html_to_txt(self):
-        filename = self.filebase.replace(self.devpostfix, '')
-        filepath = os.path.join(self.path, '{}_txt.html'.format(filename))
-        text = self.text_maker.handle(self.html)
-        encoded = text.encode('utf8')
-        with open(filepath, 'wb+') as f:
-            f.write(encoded)
-
-    def live_html(self):
-        filename = '{}{}.html'.format(self.filebase, self.livepostfix)
-        filepath = os.path.join(self.path, filename)
-        transformed = transform(self.html, allow_loading_external_files=True)
-        unquoted = unquote(transformed)
-        template = self.j2_env.from_string(unquoted)
-        rendered = template.render(**self.data)
-        encoded = rendered.encode('utf8')
-        with open(filepath, 'wb+') as f:
-            f.write(encoded)
+    def text_maker(self):
+        from .document import text_maker
+        return text_maker()
+
+    def parse_json(self, job):
+        json_filename = '{}.json'.format(job.filebase)
+        job.data = self.fixtures.load(os.path.join(job.path, json_filename))
+
+    def template_name(self, filepath):
+        """Name the jinja2 loader finds a template by, None outside HERE."""
+        relpath = os.path.relpath(filepath, HERE)
+        if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+            return None
+        return relpath.replace(os.sep, '/')
+
+    def live_template(self, source, locale=None):
+        key = (content_hash(source), locale)
+        template = self.live_templates.get(key)
+        if template is None:
+            template = self.environment(locale).from_string(source)
+            self.live_templates.set(key, template, sizeof(source))
+        return template
+
+    def prepare_html(self, job):
+        if job.html is not None:
+            return
+        name = self.template_name(job.src_path)
+        if name is None:
+            with open(job.src_path, 'rb') as f:
+                source = f.read().decode('utf8')
+            template = self.live_template(source, job.locale)
+        else:
+            template = self.environment(job.locale).get_template(name)
+        job.html = template.render()
+
+    def document(self, job):
+        if job.document is None:
+            from .document import Document
+            job.document = Document(job.html, entities=self.cmd_args.astext)
+        return job.document
+
+    def inline(self, job):
+        if job.inlined is not None:
+            return
+        from .inliner import transform
+        transformed = transform(self.document(job), self.stylesheets,
+                                allow_loading_external_files=True)
+        job.document = None
+        job.inlined = unquote(transformed)
+
+    def asset_path(self, url, path=None):
+        """Image file of a local url, None when it isn't found.
+
+        A relative url is looked up next to the template (in ``path``)
+        first, then in the current directory and ``--staticdir``.
+        """
+        directories = [HERE, getattr(self.cmd_args, 'staticdir', None)]
+        if path and not url.startswith('/'):
+            directories.insert(0, path)
+        for directory in directories:
+            if not directory:
+                continue
+            filepath = os.path.join(directory, url.lstrip('/'))
+            if os.path.isfile(filepath):
+                return os.path.abspath(filepath)
+        return None
+
+    def inline_assets(self, job):
+        if job.assets is None:
+            resolve = functools.partial(self.asset_path, path=job.path)
+            job.inlined, job.assets = self.assets.rewrite(job.inlined,
+                                                          resolve)
+
+    def premail(self, job):
+        filename = job.filebase.replace(self.devpostfix, '')
+        filepath = os.path.join(job.path, '{}.html'.format(filename))
+        self.output(job, filepath, job.inlined)
+
+    def html_to_txt(self, job):
+        filename = job.filebase.replace(self.devpostfix, '')
+        filepath = os.path.join(job.path, '{}_txt.html'.format(filename))
+        if job.text is None:
+            job.text = self.document(job).text(self.text_maker())
+        self.output(job, filepath, job.text)
+
+    def live_html(self, job):
+        filename = '{}{}.html'.format(job.filebase, self.livepostfix)
+        filepath = os.path.join(job.path, filename)
+        template = self.live_template(job.inlined, job.locale)
+        rendered = template.render(**job.data)
+        self.output(job, filepath, rendered)
+
+    def render_locales(self, job):
+        """Renders the job in every locale, on a pool of threads.
+
+        Locales which give the same html before inlining share it, so
+        css is inlined only once for them.
+        """
+        jobs = []
+        for locale in self.locales:
+            locale_job = RenderJob(job.src_path, job.generation, locale)
+            locale_job.data = job.data
+            locale_job.layout_key = job.layout_key
+            self.load_layout(locale_job)
+            jobs.append(locale_job)
+        list(self.locales_pool.map(self.prepare_html, jobs))
+        if self.cmd_args.astext:
+            list(self.locales_pool.map(self.html_to_txt, jobs))
+        layouts = collections.OrderedDict()
+        for locale_job in jobs:
+            layouts.setdefault(content_hash(locale_job.html), locale_job)
+        list(self.locales_pool.map(self.inline, layouts.values()))
+        for locale_job in jobs:
+            locale_job.inlined = layouts[content_hash(locale_job.html)].inlined
+            locale_job.document = None
+        if self.assets:
+            list(self.locales_pool.map(self.inline_assets, jobs))
+            job.assets = set().union(*(locale_job.assets
+                                       for locale_job in jobs))
+        for stage in (self.premail, self.live_html):
+            list(self.locales_pool.map(stage, jobs))
+        for locale_job in jobs:
+            job.outputs.update(locale_job.outputs)
+            self.store_layout(locale_job)
+
+
+build_handler = None
+
+
+def build_init(cmd_args):
+    global build_handler
+    build_handler = RenderHandler(cmd_args)
+
+
+def build_template(src_path):
+    start = time.time()
+    passed = build_handler.proceed(src_path)
+    return src_path, passed, time.time() - start
+
+
+def init_fixture(src_path):
+    start = time.time()
+    generator = JsonGenerator(build_handler)
+    if not build_handler.cmd_args.force and \
+            not generator.outdated(src_path):
+        return src_path, None, time.time() - start
+    create = functools.partial(generator.create_fixture, src_path)
+    passed = build_handler.passed(create, src_path)
+    return src_path, passed, time.time() - start
 
 
 class LivePremailer():
@@ -225,10 +868,8 @@ class LivePremailer():
         self.bsync_params = {
             'server': None,
             'directory': None,
-            'reloadDelay': 1000,
             'online': 'true',
             'logLevel': 'silent',
-            'files': HERE,
         }
 
     def append_arguments(self, parser):
@@ -250,6 +891,37 @@ class LivePremailer():
         parser.add_argument('--astext', action='store_true',
                             help='lpremailer will save all dev files\
                                   as simple txt messages')
+        parser.add_argument('--locales', nargs='?',
+                            help='Comma separated locales, every dev\
+                                  template is rendered once per locale')
+        parser.add_argument('--localedir', nargs='?', default=LOCALEDIR,
+                            help='Path to directory with compiled\
+                                  translations of locales')
+        parser.add_argument('--restricted', action='store_true',
+                            help='Accept only lambda expressions as\
+                                  evaluated values in json files')
+        parser.add_argument('--ignore', action='append', metavar='PATTERN',
+                            help='Files and directories matching this\
+                                  pattern are skipped while looking for dev\
+                                  templates and watching changes (can be\
+                                  repeated)')
+        parser.add_argument('--profile', nargs='?', metavar='DIR',
+                            help='Path to directory where cProfile stats\
+                                  of every render are saved')
+        parser.add_argument('--cachedir', nargs='?',
+                            help='Path to directory where compiled\
+                                  templates are cached between runs')
+        parser.add_argument('--assets', action='store_true',
+                            help='Inline small images as data uris and\
+                                  add a content hash to urls of others')
+        parser.add_argument('--inlinelimit', type=int, default=INLINE_LIMIT,
+                            metavar='BYTES',
+                            help='Largest image inlined with --assets')
+        parser.add_argument('--cachebudget', action='append',
+                            type=cache_budget, metavar='CACHE=MB',
+                            help='Megabytes a cache may hold, one of {}\
+                                  (can be repeated)'
+                                  .format(', '.join(CACHE_BUDGETS)))
 
     def parse_args(self):
         parser = argparse.ArgumentParser()
@@ -261,44 +933,176 @@ class LivePremailer():
         sub_parser.add_argument('--staticdir', nargs='?',
                                 help='Path to directory where static folder\
                                       is located')
+        sub_parser.add_argument('--polling', action='store_true',
+                                help='Poll files for changes instead of\
+                                      using native filesystem events')
+        sub_parser.add_argument('--debounce', type=int, default=100,
+                                help='Milliseconds to wait for more changes\
+                                      before rendering')
+        sub_parser.add_argument('--server', choices=(SERVER_BSYNC,
+                                                     SERVER_BUILTIN),
+                                default=SERVER_BSYNC,
+                                help='Serve previews with browser-sync or\
+                                      with a built-in server')
+        sub_parser.add_argument('--port', type=int, default=3000,
+                                help='Port of the built-in server')
+        sub_parser.add_argument('--include', action='append',
+                                metavar='PATTERN',
+                                help='Only changes of files matching this\
+                                      pattern (relative to the current\
+                                      directory) are rendered (can be\
+                                      repeated)')
+        sub_parser.add_argument('--statsinterval', type=int, default=0,
+                                help='Seconds between logs of cache\
+                                      statistics, never by default')
+        sub_parser.add_argument('--workers', type=int,
+                                default=multiprocessing.cpu_count(),
+                                help='Number of templates rendered at the\
+                                      same time')
         self.append_arguments(sub_parser)
         init_help = 'Create json files for htmls with provided\
                      postfix in current directory'
         sub_parser = subparsers.add_parser(PARSER_INIT, help=init_help)
         sub_parser.set_defaults(which=PARSER_INIT)
         sub_parser.add_argument('--force', action='store_true',
-                                help='Overwrites json files')
+                                help='Overwrites all existing json files')
+        sub_parser.add_argument('--jobs', type=int,
+                                default=multiprocessing.cpu_count(),
+                                help='Number of json files generated in\
+                                      parallel')
+        self.append_arguments(sub_parser)
+        build_help = 'Render all dev templates in current directory and exit'
+        sub_parser = subparsers.add_parser(PARSER_BUILD, help=build_help)
+        sub_parser.set_defaults(which=PARSER_BUILD)
+        sub_parser.add_argument('--jobs', type=int,
+                                default=multiprocessing.cpu_count(),
+                                help='Number of templates rendered in\
+                                      parallel')
+        sub_parser.add_argument('--staticdir', nargs='?',
+                                help='Path to directory where static folder\
+                                      is located, images are looked up\
+                                      there with --assets')
+        self.append_arguments(sub_parser)
+        merge_help = 'Render a dev template for every record of a json\
+                      array or json lines file and exit'
+        sub_parser = subparsers.add_parser(PARSER_MERGE, help=merge_help)
+        sub_parser.set_defaults(which=PARSER_MERGE)
+        sub_parser.add_argument('template', help='Path to dev template')
+        sub_parser.add_argument('records', help='Path to records file')
+        sub_parser.add_argument('--outdir', nargs='?',
+                                help='Directory where rendered records are\
+                                      saved, <template>_merge by default')
+        sub_parser.add_argument('--batch', type=int, default=BATCH_SIZE,
+                                help='Number of rendered records written\
+                                      at once')
+        sub_parser.add_argument('--staticdir', nargs='?',
+                                help='Path to directory where static folder\
+                                      is located, images are looked up\
+                                      there with --assets')
         self.append_arguments(sub_parser)
 
         self.args = parser.parse_args()
 
     def json_files(self):
-        handler = RenderHandler(self.args)
         if self.args.which == PARSER_INIT:
-            JsonGenerator(handler, HERE).generate()
-            for root, dirs, files in os.walk(HERE):
-                for _dir in dirs:
-                    path = os.path.join(root, _dir)
-                    JsonGenerator(handler, path).generate()
+            self.generate_json()
             sys.exit(1)
 
+    def generate_json(self):
+        start = time.time()
+        templates = self.dev_templates()
+        results = self.map_templates(init_fixture, templates)
+        generated = len([result for result in results if result[1]])
+        failed = len([result for result in results if result[1] is False])
+        msg = '\n{} json files generated, {} up to date, {} failed, {:.3f}s'
+        msg = msg.format(generated, len(results) - generated - failed,
+                         failed, time.time() - start)
+        logging.info(msg)
+
+    def dev_templates(self):
+        return list(dev_templates(HERE, self.args.devpostfix,
+                                  ignore_patterns(self.args)))
+
+    def map_templates(self, func, templates):
+        if self.args.jobs > 1 and len(templates) > 1:
+            pool = multiprocessing.Pool(self.args.jobs, build_init,
+                                        (self.args,))
+            try:
+                return pool.map(func, templates, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        build_init(self.args)
+        return [func(src_path) for src_path in templates]
+
+    def build(self):
+        if self.args.which != PARSER_BUILD:
+            return
+        start = time.time()
+        results = self.map_templates(build_template, self.dev_templates())
+        self.build_summary(results, time.time() - start)
+        failed = [result for result in results if not result[1]]
+        sys.exit(1 if failed else 0)
+
+    def build_summary(self, results, elapsed):
+        lines = []
+        for src_path, passed, seconds in results:
+            status = 'OK' if passed else 'FAILED'
+            relpath = os.path.relpath(src_path, HERE)
+            lines.append('{:8.3f}s  {}...{}'.format(seconds, relpath, status))
+        failed = len([result for result in results if not result[1]])
+        msg = '\n{}\n\n{} templates, {} failed, {:.3f}s total'
+        msg = msg.format('\n'.join(lines), len(results), failed, elapsed)
+        logging.info(msg)
+
+    def merge(self):
+        if self.args.which != PARSER_MERGE:
+            return
+        mail_merge = MailMerge(RenderHandler(self.args), self.args.template,
+                               self.args.outdir, self.args.batch)
+        sys.exit(0 if mail_merge.run(self.args.records) else 1)
+
     def start_observer(self):
-        self.observer = PollingObserver()
+        if self.args.polling:
+            from watchdog.observers.polling import PollingObserver
+            self.observer = PollingObserver()
+        else:
+            from watchdog.observers import Observer
+            self.observer = Observer()
         self.observer.should_keep_running()
         self.observer.handler = RenderHandler(self.args)
+        self.observer.handler.index_templates()
+        if self.args.loadhistory:
+            self.observer.handler.warm_start()
         for path in self.observer_paths:
-            self.observer.schedule(self.observer.handler,
-                                   path, recursive=True)
+            for directory, recursive in watches(path,
+                                                self.observer.handler.ignore):
+                self.observer.schedule(self.observer.handler, directory,
+                                       recursive=recursive)
+        self.observer.handler.watch = self.watch
         self.observer.start()
 
+    def watch(self, directory):
+        """Watches a directory created in one of watched paths.
+
+        Directories deeper down are covered by recursive watches already.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        if parent in map(os.path.abspath, self.observer_paths):
+            self.observer.schedule(self.observer.handler, directory,
+                                   recursive=True)
+
     def update_params(self):
-        if not os.path.exists(self.args.staticdir):
+        if not self.args.staticdir or not os.path.exists(self.args.staticdir):
             logging.warning('Static files won\'t be maintained/served.')
             return
-        files = '!**/*.less,!**/*.sass,!**/*.scss'
-        files = (self.bsync_params['files'], self.args.staticdir, files)
-        self.bsync_params['files'] = ','.join(files)
         self.bsync_params['ss'] = self.args.staticdir
+        extensions = BSYNC_EXCLUDED
+        if getattr(self.args, 'assets', False):
+            extensions += IMAGE_EXTENSIONS
+        excluded = ['!**/*{}'.format(ext) for ext in extensions]
+        self.bsync_params['files'] = ','.join([self.args.staticdir] +
+                                              excluded)
         self.observer_paths.add(self.args.staticdir)
 
     def bsync_command(self):
@@ -308,20 +1112,56 @@ class LivePremailer():
     def run_bsync(self):
         self.bsync = subprocess.Popen(self.bsync_command(), shell=True)
 
+    def start_server(self):
+        if self.args.server == SERVER_BSYNC:
+            self.bsync_params['port'] = self.args.port
+            self.run_bsync()
+            from .server import BrowserSyncReloader
+            self.reloader = BrowserSyncReloader(self.args.port)
+            self.observer.handler.subscribe(self.reloader.notify)
+            return
+        staticdir = self.bsync_params.get('ss')
+        from .server import LiveServer
+        self.server = LiveServer(HERE, staticdir, port=self.args.port)
+        self.server.start()
+        self.observer.handler.subscribe(self.server.notify)
+        logging.info('\nServing previews at {}'.format(self.server.url))
+        import webbrowser
+        webbrowser.open(self.server.url)
+
+    def stop_server(self):
+        if self.args.server == SERVER_BSYNC:
+            self.reloader.stop()
+            self.bsync.kill()
+        else:
+            self.server.stop()
+
     def run(self):
         self.parse_args()
         self.json_files()
+        self.build()
+        self.merge()
         self.update_params()
         self.start_observer()
-        self.run_bsync()
+        self.start_server()
+        handler = self.observer.handler
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1,
+                          lambda signum, frame: handler.log_cache_stats())
+        logged = time.time()
         try:
             while True:
                 time.sleep(1)
+                interval = self.args.statsinterval
+                if interval and time.time() - logged >= interval:
+                    handler.log_cache_stats()
+                    logged = time.time()
         except KeyboardInterrupt:
             if self.args.savehistory:
                 self.observer.handler.save_history()
             self.observer.stop()
-            self.bsync.kill()
+            self.observer.handler.stop()
+            self.stop_server()
         self.observer.join()
 
 
@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+
+from .utils import file_state
+
+
+class Manifest():
+    """Inputs and outputs of rendered dev templates, saved between runs.
+
+    Every entry maps a file to its ``[mtime, size, hash]`` state (``None``
+    for a missing file). A file whose mtime and size didn't change is
+    trusted without hashing, so checking an entry is cheap. Render options
+    are kept too, an entry rendered with other options is out of date.
+    """
+
+    def __init__(self, filepath, root):
+        self.filepath = filepath
+        self.root = root
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def relpath(self, filepath):
+        return os.path.relpath(filepath, self.root)
+
+    def abspath(self, relpath):
+        return os.path.normpath(os.path.join(self.root, relpath))
+
+    def load(self):
+        if not os.path.exists(self.filepath):
+            return
+        with open(self.filepath, 'r') as f:
+            entries = json.load(f)
+        with self.lock:
+            self.entries.update(entries)
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.entries, indent=4, sort_keys=True)
+        with open(self.filepath, 'w') as f:
+            f.write(data)
+
+    def record(self, src_path, inputs, outputs, options):
+        entry = {
+            'options': repr(options),
+            'inputs': dict((self.relpath(filepath), state)
+                           for filepath, state in inputs.items()),
+            'outputs': {},
+        }
+        for filepath, state in outputs.items():
+            entry['outputs'][self.relpath(filepath)] = state
+        with self.lock:
+            self.entries[self.relpath(src_path)] = entry
+
+    def unchanged(self, relpath, state):
+        filepath = self.abspath(relpath)
+        try:
+            stat = os.stat(filepath)
+        except EnvironmentError:
+            return state is None
+        if state is None:
+            return False
+        if [stat.st_mtime, stat.st_size] == state[:2]:
+            return True
+        current = file_state(filepath)
+        return current is not None and current[2] == state[2]
+
+    def outdated(self, src_path, options):
+        with self.lock:
+            entry = self.entries.get(self.relpath(src_path))
+        if entry is None or entry.get('options') != repr(options):
+            return True
+        files = list(entry['inputs'].items()) + list(entry['outputs'].items())
+        for relpath, state in files:
+            if not self.unchanged(relpath, state):
+                return True
+        return False
@@ -0,0 +1,161 @@
+import functools
+import json
+import logging
+import os
+import re
+import time
+
+from .jobs import RenderJob
+from .utils import write_if_changed
+
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 100
+
+WHITESPACE_RE = re.compile(r'\s*')
+
+
+def array_records(f, buffer, decoder, chunk_size=CHUNK_SIZE):
+    """Yields items of a json array, reading ``f`` chunk by chunk.
+
+    Items have to be separated by exactly one comma, a malformed array
+    raises ``ValueError``.
+    """
+    pos = buffer.index('[') + 1
+    item = True
+    first = True
+    while True:
+        pos = WHITESPACE_RE.match(buffer, pos).end()
+        if pos == len(buffer):
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError('Unterminated json array')
+            buffer, pos = chunk, 0
+            continue
+        if buffer[pos] == ']' and (first or not item):
+            return
+        if not item:
+            if buffer[pos] != ',':
+                msg = 'Expecting \',\' or \']\' in json array: {!r}'
+                raise ValueError(msg.format(buffer[pos:pos + 20]))
+            pos += 1
+            item = True
+            continue
+        try:
+            record, pos = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        item = False
+        first = False
+        yield record
+
+
+def line_records(f, decoder):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield decoder.decode(line)
+
+
+def records(filepath, object_hook=None, chunk_size=CHUNK_SIZE):
+    """Yields records of a json array or json lines file one by one.
+
+    Only the record being decoded (and a chunk of the file) is kept in
+    memory, however many records the file holds.
+    """
+    decoder = json.JSONDecoder(object_hook=object_hook)
+    with open(filepath, 'r') as f:
+        buffer = f.read(chunk_size)
+        if buffer.lstrip().startswith('['):
+            items = array_records(f, buffer, decoder, chunk_size)
+        else:
+            f.seek(0)
+            items = line_records(f, decoder)
+        for record in items:
+            if not isinstance(record, dict):
+                raise ValueError('Record is not an object: {}'.format(record))
+            yield record
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class MailMerge():
+    """Renders one dev template against many records.
+
+    The template is rendered, inlined and compiled once; every record
+    (laid over the template's own json file, if there is one) only goes
+    through the compiled live template. Outputs are written in batches
+    to ``outdir`` as ``<name>_<record number>.html``.
+    """
+
+    def __init__(self, handler, src_path, outdir=None,
+                 batch_size=BATCH_SIZE):
+        self.handler = handler
+        self.job = RenderJob(os.path.abspath(src_path))
+        self.name = self.job.filebase.replace(handler.devpostfix, '')
+        self.outdir = outdir or os.path.join(
+            self.job.path, '{}_merge'.format(self.name))
+        self.batch_size = batch_size
+        self.template = None
+        self.base = {}
+        self.outputs = []
+        self.rendered = 0
+        self.failed = 0
+
+    def prepare(self):
+        job = self.job
+        fixture = os.path.join(job.path, '{}.json'.format(job.filebase))
+        if os.path.exists(fixture):
+            self.base = self.handler.fixtures.load(fixture)
+        self.handler.prepare_html(job)
+        self.handler.inline(job)
+        if self.handler.assets:
+            self.handler.inline_assets(job)
+        self.template = self.handler.live_template(job.inlined)
+
+    def render(self, index, record):
+        context = dict(self.base)
+        context.update(record)
+        filename = '{}_{}.html'.format(self.name, index)
+        filepath = os.path.join(self.outdir, filename)
+        self.outputs.append(
+            (filepath, self.template.render(**context).encode('utf8')))
+
+    def merge(self, records_path):
+        os.makedirs(self.outdir, exist_ok=True)
+        object_hook = self.handler.fixtures.object_hook
+        items = enumerate(records(records_path, object_hook), 1)
+        for batch in batches(items, self.batch_size):
+            self.outputs = []
+            for index, record in batch:
+                render = functools.partial(self.render, index, record)
+                where = '{} (record {})'.format(records_path, index)
+                if not self.handler.passed(render, where):
+                    self.failed += 1
+            for filepath, content in self.outputs:
+                write_if_changed(filepath, content)
+            self.rendered += len(self.outputs)
+
+    def run(self, records_path):
+        """Returns True if every record was merged."""
+        start = time.time()
+        passed = self.handler.passed(self.prepare, self.job.src_path) and \
+            self.handler.passed(functools.partial(self.merge, records_path),
+                                records_path)
+        msg = '\n{} records merged into {}, {} failed, {:.3f}s total'
+        logging.info(msg.format(self.rendered, self.outdir, self.failed,
+                                time.time() - start))
+        return passed and not self.failed
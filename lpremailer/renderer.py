@@ -0,0 +1,129 @@
+import collections
+import os
+import threading
+
+from .cache import LRUCache
+from .locales import LOCALEDIR, translations
+from .utils import unquote
+
+
+LAYOUTS_CACHE_SIZE = 400
+
+Layout = collections.namedtuple('Layout', ['version', 'html', 'text'])
+
+
+class Renderer():
+    """Renders dev templates in memory, for sending what was previewed.
+
+    ``render`` returns the html of the live preview and, with ``astext``,
+    the text ``--astext`` gives, for any context. A template is rendered
+    and inlined once; the compiled layout is kept and every later call
+    only renders it with its context. With ``auto_reload`` a layout is
+    built again when the template, a template it uses or a stylesheet
+    changes; without it layouts are kept until ``clear``.
+
+    A renderer can be shared between threads.
+    """
+
+    def __init__(self, template_dir, static_dir=None, astext=True,
+                 locale=None, localedir=None, auto_reload=False,
+                 cache_size=LAYOUTS_CACHE_SIZE):
+        self.template_dir = os.path.abspath(template_dir)
+        self.static_dir = static_dir and os.path.abspath(static_dir)
+        self.astext = astext
+        self.locale = locale
+        self.localedir = localedir
+        self.auto_reload = auto_reload
+        self.layouts = LRUCache(cache_size)
+        self.lock = threading.Lock()
+        self.j2_env = None
+        self.stylesheets = None
+        self.dependencies = None
+
+    def setup(self):
+        from jinja2 import Environment, FileSystemLoader
+        from .dependencies import DependencyIndex
+        from .inliner import StylesheetCache
+        j2_env = Environment(
+            loader=FileSystemLoader(self.template_dir),
+            extensions=["jinja2.ext.i18n"], auto_reload=self.auto_reload)
+        j2_env.install_gettext_translations(
+            translations(self.locale, self.localedir or LOCALEDIR))
+        self.stylesheets = StylesheetCache()
+        self.dependencies = DependencyIndex(j2_env, self.template_dir)
+        self.j2_env = j2_env
+
+    def render(self, template_name, context=None):
+        """Returns ``(html, text)``, text is None without ``astext``."""
+        layout = self.layout(template_name)
+        context = context or {}
+        text = layout.text.render(**context) if layout.text else None
+        return layout.html.render(**context), text
+
+    def render_many(self, template_name, contexts):
+        """Yields ``(html, text)`` for every context, lazily."""
+        layout = self.layout(template_name)
+        for context in contexts:
+            text = layout.text.render(**context) if layout.text else None
+            yield layout.html.render(**context), text
+
+    def clear(self):
+        self.layouts.clear()
+
+    def layout(self, template_name):
+        version = self.version(template_name)
+        layout = self.layouts.get(template_name)
+        if layout is not None and layout.version == version:
+            return layout
+        with self.lock:
+            layout = self.layouts.get(template_name)
+            if layout is None or layout.version != version:
+                layout = self.build(template_name)
+                self.layouts.set(template_name, layout)
+        return layout
+
+    def filepaths(self, template_name):
+        filepath = os.path.join(self.template_dir, template_name)
+        return [filepath] + sorted(self.dependencies.dependencies(filepath))
+
+    def version(self, template_name):
+        if not self.auto_reload:
+            return None
+        if self.j2_env is None:
+            with self.lock:
+                if self.j2_env is None:
+                    self.setup()
+        filepath = os.path.join(self.template_dir, template_name)
+        if filepath not in self.dependencies.templates:
+            self.dependencies.add(filepath)
+        version = []
+        for filepath in self.filepaths(template_name):
+            try:
+                stat = os.stat(filepath)
+            except EnvironmentError:
+                version.append(None)
+                continue
+            version.append((stat.st_mtime, stat.st_size))
+        return tuple(version)
+
+    def build(self, template_name):
+        from .document import Document, text_maker
+        from .inliner import transform
+        if self.j2_env is None:
+            self.setup()
+        if self.auto_reload:
+            for filepath in self.filepaths(template_name):
+                if not filepath.endswith('.css'):
+                    self.dependencies.update(filepath)
+        version = self.version(template_name)
+        html = self.j2_env.get_template(template_name).render()
+        document = Document(html, entities=self.astext)
+        text = None
+        if self.astext:
+            text = self.j2_env.from_string(document.text(text_maker()))
+        inlined = transform(document, self.stylesheets,
+                            base_path=self.template_dir,
+                            static_dir=self.static_dir,
+                            allow_loading_external_files=True)
+        return Layout(version, self.j2_env.from_string(unquote(inlined)),
+                      text)
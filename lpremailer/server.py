@@ -0,0 +1,245 @@
+import asyncio
+import html
+import mimetypes
+import os
+import logging
+import queue
+import threading
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+from urllib.request import urlopen
+
+from .events import OUTPUTS
+
+
+EVENTS_PATH = '/__lpremailer__/events'
+BSYNC_PATH = '/__browser_sync__'
+BSYNC_TIMEOUT = 1
+
+RELOAD_SCRIPT = """<script>
+(function () {{
+  var page = encodeURIComponent(location.pathname);
+  var source = new EventSource('{}?page=' + page);
+  source.addEventListener('reload', function () {{ location.reload(); }});
+}})();
+</script>
+""".format(EVENTS_PATH)
+
+RESPONSES = {
+    200: 'OK',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+}
+
+
+def all_tasks(loop):
+    if hasattr(asyncio, 'all_tasks'):
+        return asyncio.all_tasks(loop)
+    return asyncio.Task.all_tasks(loop)
+
+
+class LiveServer():
+    """Serves templates and static files and reloads previews on change.
+
+    Html pages get a small script which listens to server-sent events;
+    ``notify`` pushes a reload only to pages showing one of rendered files
+    (or listing the directory they are in). Previews have their css
+    inlined, so an edited stylesheet reloads the previews rendered again.
+    The server runs its own asyncio loop in a background thread.
+    """
+
+    def __init__(self, root, staticdir=None, host='localhost', port=3000):
+        self.roots = [os.path.abspath(root)]
+        if staticdir:
+            self.roots.append(os.path.abspath(staticdir))
+        self.host = host
+        self.port = port
+        self.clients = {}
+        self.loop = None
+        self.server = None
+        self.started = threading.Event()
+
+    @property
+    def url(self):
+        return 'http://{}:{}/'.format(self.host, self.port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        self.started.wait()
+
+    def serve(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        coroutine = asyncio.start_server(self.handle, self.host, self.port)
+        self.server = self.loop.run_until_complete(coroutine)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            tasks = all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+
+    def stop(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def notify(self, change):
+        filepaths = set(os.path.abspath(filepath)
+                        for filepath in change.filepaths)
+        if not self.loop:
+            return
+        if change.kind == OUTPUTS:
+            self.loop.call_soon_threadsafe(self.push, filepaths)
+
+    def push(self, filepaths):
+        directories = set(os.path.dirname(filepath) for filepath in filepaths)
+        for writer, filepath in list(self.clients.items()):
+            if filepath in filepaths or filepath in directories:
+                writer.write(b'event: reload\ndata: reload\n\n')
+
+    def resolve(self, path):
+        relpath = unquote(path).lstrip('/')
+        for root in self.roots:
+            filepath = os.path.normpath(os.path.join(root, relpath))
+            if filepath != root and \
+                    not filepath.startswith(root.rstrip(os.sep) + os.sep):
+                continue
+            if os.path.exists(filepath):
+                return filepath
+        return None
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request.decode('latin1').split()
+            if len(parts) < 2:
+                return
+            method, target = parts[0], parts[1]
+            url = urlsplit(target)
+            if method != 'GET':
+                self.respond(writer, 405, b'')
+            elif url.path == EVENTS_PATH:
+                await self.events(writer, parse_qs(url.query))
+                return
+            else:
+                self.respond(writer, *self.page(url.path))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    async def events(self, writer, query):
+        page = query.get('page', ['/'])[0]
+        filepath = self.resolve(page)
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\n\r\n')
+        self.clients[writer] = filepath
+        try:
+            while not writer.transport.is_closing():
+                writer.write(b': ping\n\n')
+                await writer.drain()
+                await asyncio.sleep(15)
+        finally:
+            self.clients.pop(writer, None)
+
+    def page(self, path):
+        filepath = self.resolve(path)
+        if filepath is None:
+            return 404, b'Not Found', 'text/plain'
+        if os.path.isdir(filepath):
+            return 200, self.listing(path, filepath), 'text/html'
+        try:
+            with open(filepath, 'rb') as f:
+                content = f.read()
+        except EnvironmentError:
+            return 403, b'Forbidden', 'text/plain'
+        content_type = mimetypes.guess_type(filepath)[0]
+        if content_type == 'text/html':
+            content = self.inject(content)
+        return 200, content, content_type or 'application/octet-stream'
+
+    def inject(self, content):
+        script = RELOAD_SCRIPT.encode('utf8')
+        index = content.lower().rfind(b'</body>')
+        if index == -1:
+            return content + script
+        return content[:index] + script + content[index:]
+
+    def listing(self, path, directory):
+        base = path if path.endswith('/') else path + '/'
+        links = []
+        for filename in sorted(os.listdir(directory)):
+            if os.path.isdir(os.path.join(directory, filename)):
+                filename += '/'
+            links.append('<li><a href="{}">{}</a></li>'.format(
+                quote(base + filename), html.escape(filename)))
+        page = '<html><body><h1>{}</h1><ul>{}</ul></body></html>'.format(
+            html.escape(base), ''.join(links))
+        return self.inject(page.encode('utf8'))
+
+    def respond(self, writer, status, content, content_type='text/plain'):
+        headers = [
+            'HTTP/1.1 {} {}'.format(status, RESPONSES[status]),
+            'Content-Type: {}'.format(content_type),
+            'Content-Length: {}'.format(len(content)),
+            'Cache-Control: no-cache',
+            'Connection: close',
+        ]
+        writer.write('\r\n'.join(headers).encode('latin1') + b'\r\n\r\n')
+        writer.write(content)
+
+
+class BrowserSyncReloader():
+    """Reloads browser-sync previews through its http protocol.
+
+    Browser-sync doesn't watch rendered files itself; every announced
+    change is sent as one ``reload`` call, so a render reloads browsers
+    once.
+    Calls are made from a background thread, a slow or stopped
+    browser-sync never holds up renders.
+    """
+
+    def __init__(self, port, host='localhost'):
+        self.url = 'http://{}:{}{}'.format(host, port, BSYNC_PATH)
+        self.changes = queue.Queue()
+        self.thread = threading.Thread(target=self.send)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def notify(self, change):
+        self.changes.put(change)
+
+    def stop(self):
+        self.changes.put(None)
+        self.thread.join()
+
+    def send(self):
+        while True:
+            change = self.changes.get()
+            if change is None:
+                return
+            self.reload(change)
+
+    def reload(self, change):
+        params = [('method', 'reload')]
+        params.extend(('args', filepath) for filepath in change.filepaths)
+        try:
+            urlopen('{}?{}'.format(self.url, urlencode(params)),
+                    timeout=BSYNC_TIMEOUT).close()
+        except EnvironmentError as e:
+            logging.debug('Browser-sync reload failed: {}'.format(e))
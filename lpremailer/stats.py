@@ -0,0 +1,99 @@
+import collections
+import os
+import threading
+
+
+STATS_WINDOW = 100
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = int(round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def milliseconds(seconds):
+    return '{:.1f}ms'.format(seconds * 1000)
+
+
+def format_timings(timings):
+    return ', '.join('{} {}'.format(name, milliseconds(seconds))
+                     for name, seconds in timings.items())
+
+
+def format_size(size):
+    if size < 1024 * 1024:
+        return '{:.1f}KB'.format(size / 1024.0)
+    return '{:.1f}MB'.format(size / 1024.0 / 1024.0)
+
+
+def format_cache_stats(name, stats):
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = '{:.0%}'.format(stats['hits'] / lookups) if lookups else '-'
+    return '{} {} entries, {}, hit rate {}'.format(
+        name, stats['entries'], format_size(stats['bytes']), hit_rate)
+
+
+def resident_size():
+    """Resident memory of the process in bytes, None if it's unknown."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (EnvironmentError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # peak size, in kilobytes everywhere but on macOS
+    return maxrss if os.uname()[0] == 'Darwin' else maxrss * 1024
+
+
+class RenderStats():
+    """Rolling statistics of render times per template.
+
+    Only the last ``window`` renders of a template are used to compute
+    percentiles, ``count`` covers all of them.
+    """
+
+    def __init__(self, window=STATS_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def add(self, src_path, seconds):
+        with self.lock:
+            samples = self.samples.get(src_path)
+            if samples is None:
+                samples = collections.deque(maxlen=self.window)
+                self.samples[src_path] = samples
+            samples.append(seconds)
+            self.counts[src_path] += 1
+
+    def discard(self, src_path):
+        with self.lock:
+            self.samples.pop(src_path, None)
+            self.counts.pop(src_path, None)
+
+    def summary(self, src_path):
+        with self.lock:
+            samples = list(self.samples.get(src_path, ()))
+            count = self.counts[src_path]
+        if not samples:
+            return None
+        return {
+            'count': count,
+            'p50': percentile(samples, 0.5),
+            'p95': percentile(samples, 0.95),
+            'max': max(samples),
+        }
+
+    def format(self, src_path):
+        summary = self.summary(src_path)
+        if summary is None:
+            return ''
+        return 'renders {}, p50 {}, p95 {}, max {}'.format(
+            summary['count'], milliseconds(summary['p50']),
+            milliseconds(summary['p95']), milliseconds(summary['max']))
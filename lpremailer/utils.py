@@ -1,13 +1,34 @@
+import ast
+import fnmatch
+import functools
 import json
 import os
-import urllib
+import urllib.parse
 
-import six
-from jinja2 import nodes
-from random_words import RandomWords
+from .cache import LRUCache, content_hash
+from .jobs import RenderJob
 
 
-rw = RandomWords()
+class LazyRandomWords():
+    """RandomWords reading its word list on the first random word."""
+
+    def __init__(self):
+        self.words = None
+
+    def random_word(self):
+        if self.words is None:
+            from random_words import RandomWords
+            self.words = RandomWords()
+        return self.words.random_word()
+
+
+rw = LazyRandomWords()
+
+IGNORE_PATTERNS = ('.git', '.hg', '.svn', '__pycache__', 'node_modules')
+FIXTURES_CACHE_SIZE = 400
+LAMBDAS_CACHE_SIZE = 1024
+
+lambdas = LRUCache(LAMBDAS_CACHE_SIZE)
 
 
 def parse_params(params):
@@ -16,23 +37,140 @@ def parse_params(params):
         for key, value in params.items()))
 
 
+def ignored(name, patterns):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def dev_templates(top, devpostfix, ignore=IGNORE_PATTERNS):
+    """Yields dev templates below ``top`` in sorted order.
+
+    Directories matching one of ``ignore`` patterns aren't entered.
+    """
+    suffix = '{}.html'.format(devpostfix)
+    try:
+        entries = sorted(os.scandir(top), key=lambda entry: entry.name)
+    except EnvironmentError:
+        return
+    directories = []
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if not ignored(entry.name, ignore):
+                directories.append(entry.path)
+        elif entry.name.endswith(suffix):
+            yield entry.path
+    for directory in directories:
+        for template in dev_templates(directory, devpostfix, ignore):
+            yield template
+
+
+def watches(top, ignore=IGNORE_PATTERNS):
+    """Yields ``(directory, recursive)`` watches covering ``top``.
+
+    ``top`` is watched alone and each of its directories recursively, so
+    directories in ``top`` matching one of ``ignore`` patterns (where
+    ``node_modules`` and build directories usually are) aren't watched
+    at all.
+    """
+    yield top, False
+    try:
+        entries = sorted(os.scandir(top), key=lambda entry: entry.name)
+    except EnvironmentError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False) and \
+                not ignored(entry.name, ignore):
+            yield entry.path, True
+
+
+def file_state(filepath):
+    try:
+        stat = os.stat(filepath)
+        with open(filepath, 'rb') as f:
+            digest = content_hash(f.read())
+    except EnvironmentError:
+        return None
+    return [stat.st_mtime, stat.st_size, digest]
+
+
+def write_if_changed(filepath, content):
+    try:
+        if os.path.getsize(filepath) == len(content):
+            with open(filepath, 'rb') as f:
+                if f.read() == content:
+                    return False
+    except EnvironmentError:
+        pass
+    with open(filepath, 'wb+') as f:
+        f.write(content)
+    return True
+
+
 def unquote(html):
-    if six.PY3:
-        return urllib.parse.unquote(html)
-    return urllib.unquote(html)
+    return urllib.parse.unquote(html)
+
+
+def compile_lambda(source, restricted=False):
+    """Compiles a lambda from a json file, once per source.
+
+    In restricted mode the source has to be a single lambda expression
+    which doesn't touch any dunder name or attribute.
+    """
+    key = (source, restricted)
+    code = lambdas.get(key)
+    if code is None:
+        if restricted:
+            tree = ast.parse(source.strip(), mode='eval')
+            if not isinstance(tree.body, ast.Lambda):
+                raise ValueError('Not a lambda expression: {}'.format(source))
+            for node in ast.walk(tree):
+                name = getattr(node, 'id', None) or getattr(node, 'attr', '')
+                if name.startswith('__'):
+                    raise ValueError('Forbidden name in: {}'.format(source))
+            code = compile(tree, '<json>', 'eval')
+        else:
+            code = compile(source, '<json>', 'eval')
+        lambdas.set(key, code)
+    return eval(code)
 
 
-def object_hook(obj):
+def object_hook(obj, restricted=False):
     result = {}
     for key, value in obj.items():
-        if isinstance(value, six.string_types) and u'lambda' in value:
-            result[key] = eval(value)
+        if isinstance(value, str) and u'lambda' in value:
+            result[key] = compile_lambda(value, restricted)
         else:
             result[key] = value
     return result
 
 
+class FixtureCache():
+    """Json files loaded with their lambdas evaluated.
+
+    Loaded data is kept per path and validated with the file's
+    modification time and size, so an unchanged json file is read and
+    evaluated only once. Templates share the cached data.
+    """
+
+    def __init__(self, maxsize=FIXTURES_CACHE_SIZE, restricted=False,
+                 maxbytes=None):
+        self.fixtures = LRUCache(maxsize, maxbytes)
+        self.object_hook = functools.partial(object_hook,
+                                             restricted=restricted)
+
+    def load(self, filepath):
+        stat = os.stat(filepath)
+        version = (stat.st_mtime, stat.st_size)
+        cached = self.fixtures.get(filepath)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with open(filepath, 'r') as fjson:
+            data = json.load(fjson, object_hook=self.object_hook)
+        self.fixtures.set(filepath, (version, data))
+        return data
+
+
 def follow(item):
+    from jinja2 import nodes
     if isinstance(item.node, nodes.Getattr):
         for x in follow(item.node):
             yield x
@@ -40,6 +178,7 @@ def follow(item):
 
 
 def tokenize(node, _dict):
+    from jinja2 import nodes
     if isinstance(node, nodes.Output):
         for item in node.nodes:
             tokenize(item, _dict)
@@ -95,34 +234,46 @@ def tokenize(node, _dict):
 
 
 class JsonGenerator():
-    def __init__(self, handler, path):
+    def __init__(self, handler):
         self.handler = handler
-        self.path = path
 
-    def filepath(self, ext):
-        filename = '{}.{}'.format(self.handler.filebase, ext)
-        return os.path.join(self.path, filename)
+    @staticmethod
+    def fixture_path(src_path):
+        return '{}.json'.format(os.path.splitext(src_path)[0])
 
-    def feed(self):
+    def feed(self, src_path):
         results = {}
-        self.handler.file_vars(self.filepath('html'))
-        self.handler.prepare_html()
-        parsed = self.handler.j2_env.parse(self.handler.html)
+        job = RenderJob(src_path)
+        self.handler.prepare_html(job)
+        parsed = self.handler.j2_env.parse(job.html)
         for node in parsed.body:
             tokenize(node, results)
         return results
 
-    def create_file(self):
-        filepath = self.filepath('json')
-        force = self.handler.cmd_args.force
-        save = force and force or not os.path.exists(filepath)
-        if save:
-            with open(filepath, 'w') as fjson:
-                json.dump(self.feed(), fjson, indent=4)
-
-    def generate(self):
-        for filename in os.listdir(self.path):
-            filepath = os.path.join(self.path, filename)
-            self.handler.file_vars(filepath)
-            if self.handler.filebase.endswith(self.handler.devpostfix):
-                self.create_file()
+    def create_fixture(self, src_path):
+        results = self.feed(src_path)
+        with open(self.fixture_path(src_path), 'w') as fjson:
+            json.dump(results, fjson, indent=4)
+
+    def outdated(self, src_path):
+        """Whether the template or one of templates it uses is newer than
+        its fixture.
+
+        Stylesheets are skipped, they can't change variables of a fixture.
+        """
+        try:
+            fixture_mtime = os.path.getmtime(self.fixture_path(src_path))
+        except EnvironmentError:
+            return True
+        dependencies = self.handler.dependencies
+        dependencies.add(src_path)
+        filepaths = [src_path] + sorted(dependencies.dependencies(src_path))
+        for filepath in filepaths:
+            if filepath.endswith('.css'):
+                continue
+            try:
+                if os.path.getmtime(filepath) > fixture_mtime:
+                    return True
+            except EnvironmentError:
+                continue
+        return False
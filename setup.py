@@ -27,12 +27,12 @@ setup(
         ]
     },
     install_requires=[
-        'jinja2', 'premailer', 'watchdog', 'six', 'RandomWords',
+        'jinja2', 'premailer', 'watchdog', 'RandomWords',
         'html2text', 'Babel'
     ],
+    python_requires='>=3.5',
     classifiers=[
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.3',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import mock
+
+from lpremailer.assets import AssetCache, fingerprint
+
+
+HTML = """<img src="img/logo.png">
+<img src="img/photo.jpg?w=100">
+<img src="{{ avatar }}"><img src="http://example.com/a.png">
+<td style="background:url(&quot;img/logo.png&quot;)">
+"""
+
+
+def resolver(tmpdir):
+    def resolve(url):
+        filepath = tmpdir.join(url)
+        return str(filepath) if filepath.check(file=1) else None
+    return resolve
+
+
+def test_rewrite(tmpdir):
+    tmpdir.mkdir('img').join('logo.png').write_binary(b'logo')
+    tmpdir.join('img', 'photo.jpg').write_binary(b'p' * 100)
+    assets = AssetCache(inline_limit=10)
+    html, filepaths = assets.rewrite(HTML, resolver(tmpdir))
+    logo = 'data:image/png;base64,bG9nbw=='
+    assert '<img src="{}">'.format(logo) in html
+    assert 'url(&quot;{}&quot;)'.format(logo) in html
+    photo = assets.get(str(tmpdir.join('img', 'photo.jpg')))
+    assert photo.uri is None
+    assert 'img/photo.jpg?w=100&v={}"'.format(photo.digest[:12]) in html
+    assert '{{ avatar }}' in html
+    assert 'http://example.com/a.png' in html
+    assert filepaths == {str(tmpdir.join('img', 'logo.png')),
+                         str(tmpdir.join('img', 'photo.jpg'))}
+
+
+def test_rewrite_expression(tmpdir):
+    tmpdir.mkdir('img').join('logo.png').write_binary(b'logo')
+    html = """<img src="{{ request.static_url('img/logo.png') }}">
+<img src="{{ request.static_url(path) }}">"""
+    assets = AssetCache(inline_limit=2)
+    html, filepaths = assets.rewrite(html, resolver(tmpdir))
+    logo = assets.get(str(tmpdir.join('img', 'logo.png')))
+    assert "static_url('img/logo.png') }}}}?v={}\"".format(
+        logo.digest[:12]) in html
+    assert 'static_url(path) }}"' in html
+    assert filepaths == {str(tmpdir.join('img', 'logo.png'))}
+
+    html, _ = AssetCache().rewrite(
+        """<img src="{{ request.static_url('img/logo.png') }}">""",
+        resolver(tmpdir))
+    assert html == '<img src="data:image/png;base64,bG9nbw==">'
+
+
+def test_fingerprint():
+    assert fingerprint('a.png?v=1&w=2', 'abcdef') == 'a.png?w=2&v=abcdef'
+
+
+def test_disk_cache(tmpdir):
+    image = tmpdir.join('logo.png')
+    image.write_binary(b'logo')
+    directory = str(tmpdir.join('cache'))
+    asset = AssetCache(directory).get(str(image))
+    with mock.patch.object(AssetCache, 'create') as create:
+        assert AssetCache(directory).get(str(image)) == asset
+    assert not create.called
+
+    image.write_binary(b'new logo')
+    assert AssetCache(directory).get(str(image)).digest != asset.digest
+
+
+def test_disk_cache_evicted(tmpdir):
+    directory = tmpdir.join('cache')
+    assets = AssetCache(str(directory), inline_limit=0, maxbytes=100)
+    for index in range(5):
+        image = tmpdir.join('logo{}.png'.format(index))
+        image.write_binary(b'logo')
+        assets.get(str(image))
+    assert len(directory.listdir()) < 5
+    assert assets.disk.size <= 100
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from lpremailer.cache import LRUCache, RenderCache, sizeof
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_lru_cache_maxbytes():
+    cache = LRUCache(maxsize=10, maxbytes=100)
+    cache.set('a', 'a', size=40)
+    cache.set('b', 'b', size=40)
+    cache.get('a')
+    cache.set('c', 'c', size=40)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.stats() == {'entries': 2, 'bytes': 80, 'hits': 1,
+                             'misses': 1}
+    cache.pop('a')
+    assert cache.size == 40
+    cache.set('d', 'd' * 1000)
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_sizeof():
+    assert sizeof({'a': ['b' * 100]}) > sizeof('b' * 100) > 100
+
+
+def test_render_cache_persists(tmpdir):
+    directory = str(tmpdir.join('renders'))
+    cache = RenderCache(directory)
+    cache.set('key', {'/tmp/hello.html': b'hello'})
+    cache = RenderCache(directory)
+    assert cache.get('key') == {'/tmp/hello.html': b'hello'}
+    assert cache.get('missing') is None
+
+
+def test_render_cache_eviction(tmpdir):
+    for directory in (None, str(tmpdir)):
+        cache = RenderCache(directory, maxbytes=100)
+        cache.set('a', {'a': b'a' * 40})
+        cache.set('b', {'b': b'b' * 40})
+        cache.get('a')
+        cache.set('c', {'c': b'c' * 40})
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+        assert cache.size <= 100
+    assert sorted(tmpdir.listdir()) == [tmpdir.join('a'), tmpdir.join('c')]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+from jinja2 import Environment
+
+from lpremailer.dependencies import DependencyIndex, stylesheets
+
+
+HEADER = """{% raw %}<html><head>
+<link rel="stylesheet" href="static/mail.css"/>
+<link rel="stylesheet" href="https://example.com/remote.css"/>
+</head><body>{% endraw %}"""
+
+
+@pytest.fixture
+def tree(tmpdir):
+    tmpdir.mkdir('partials')
+    tmpdir.join('partials', '_header.html').write(HEADER)
+    tmpdir.join('partials', '_footer.html').write('</body></html>')
+    tmpdir.join('partials', '_base.html').write(
+        "{% include 'partials/_header.html' %}")
+    tmpdir.join('hello_dev.html').write(
+        "{% extends 'partials/_base.html' %}")
+    tmpdir.join('bye_dev.html').write(
+        "{% include 'partials/_footer.html' %}")
+    return tmpdir
+
+
+@pytest.fixture
+def index(tree):
+    index = DependencyIndex(Environment(), str(tree))
+    index.scan(str(tree), '_dev')
+    return index
+
+
+def test_stylesheets():
+    hrefs = list(stylesheets(HEADER))
+    assert hrefs == ['static/mail.css']
+
+
+def test_dependencies(tree, index):
+    expected = {
+        str(tree.join('partials', '_base.html')),
+        str(tree.join('partials', '_header.html')),
+        str(tree.join('static', 'mail.css')),
+    }
+    assert index.dependencies(str(tree.join('hello_dev.html'))) == expected
+
+
+def test_dependents(tree, index):
+    hello = str(tree.join('hello_dev.html'))
+    bye = str(tree.join('bye_dev.html'))
+    css = os.path.join(str(tree), 'static', 'mail.css')
+    assert index.changed(css) == {hello}
+    assert index.changed(str(tree.join('partials', '_footer.html'))) == {bye}
+    assert index.changed(str(tree.join('partials', '_header.html'))) == {hello}
+
+
+def test_incremental_update(tree, index):
+    hello = str(tree.join('hello_dev.html'))
+    bye = str(tree.join('bye_dev.html'))
+    tree.join('bye_dev.html').write(
+        "{% include 'partials/_header.html' %}"
+        "{% include 'partials/_footer.html' %}")
+    index.add(bye)
+    css = os.path.join(str(tree), 'static', 'mail.css')
+    assert index.changed(css) == {hello, bye}
+
+    tree.join('partials', '_footer.html').write(
+        "{% import 'partials/_macros.html' as macros %}")
+    tree.join('partials', '_macros.html').write('')
+    assert index.changed(str(tree.join('partials', '_footer.html'))) == {bye}
+    macros = str(tree.join('partials', '_macros.html'))
+    assert index.changed(macros) == {bye}
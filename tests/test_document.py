@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import glob
+import os
+
+import html2text
+import pytest
+
+from lpremailer.document import Document
+from lpremailer.inliner import StylesheetCache, transform
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES = os.path.join(os.path.dirname(HERE), 'examples')
+
+NEWSLETTER = u"""<!DOCTYPE html>
+<html>
+<head>
+<title>News &amp; views</title>
+<style>p { color: red; } td.cell > b { font-weight: bold; }</style>
+</head>
+<body>
+<h1>Tom &amp; Jerry&nbsp;&nbsp;&copy; 2020 &#169; &#xA9;</h1>
+<p>&eacute;t&eacute; &lt;b&gt; Tom & Jerry &apos; &foo; żółć ©</p>
+<a href="http://example.com/?a=1&amp;b=2">link</a><br>line<br/>two
+<ul><li>one</li><li><b>&copy; two</b>three</li></ul>
+<table><tr><td class="cell"><b>a</b></td><td>b</td></tr></table>
+<!-- comment &amp; -->
+<img src="logo.png" alt="Logo &amp; co">
+</body>
+</html>
+"""
+
+
+def documents():
+    yield 'newsletter', NEWSLETTER
+    pattern = os.path.join(EXAMPLES, '**', '*_live.html')
+    for filepath in sorted(glob.glob(pattern, recursive=True)):
+        with open(filepath) as f:
+            yield os.path.relpath(filepath, EXAMPLES), f.read()
+    yield 'no doctype', u'<html><body><p>Hi&nbsp;there</p></body></html>'
+
+
+def text_maker():
+    maker = html2text.HTML2Text()
+    maker.ignore_images = True
+    return maker
+
+
+@pytest.mark.parametrize('name,html', list(documents()))
+def test_same_outputs(name, html):
+    document = Document(html, entities=True)
+    assert document.text(text_maker()) == text_maker().handle(html)
+    expected = transform(html, StylesheetCache())
+    assert transform(document, StylesheetCache()) == expected
+    assert transform(Document(html), StylesheetCache()) == expected
+
+
+@pytest.mark.parametrize('extra,placeholders', [
+    (u'', None),
+    (u'', 2),
+    (u'\U000F0001', None),
+])
+def test_many_references(monkeypatch, extra, placeholders):
+    if placeholders:
+        monkeypatch.setattr('lpremailer.document.PLACEHOLDERS', placeholders)
+    html = u'<html><body><p>{}</p><p>&copy; &eacute; {}</p>' \
+        u'</body></html>'.format('a&amp;b ' * 70000, extra)
+    document = Document(html, entities=True)
+    assert (document.html is None) == (not extra and not placeholders)
+    assert document.text(text_maker()) == text_maker().handle(html)
+    assert transform(document, StylesheetCache()) == \
+        transform(html, StylesheetCache())
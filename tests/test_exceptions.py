@@ -4,15 +4,13 @@ import logging
 import unittest
 
 import pytest
-import six
 from jinja2 import Environment, FileSystemLoader
 from premailer import transform
 
 from lpremailer import RenderHandler
 from lpremailer.exceptions import (LiveExternalNotFoundError, LiveJSONDecodeError,
                                    LiveTemplateNotFound, LiveTemplateSyntaxError,
-                                   LiveUndefinedError, LiveUnicodeDecodeError,
-                                   LiveUnicodeEncodeError, LiveValueError)
+                                   LiveUndefinedError, LiveValueError)
 from lpremailer.utils import object_hook
 
 
@@ -80,32 +78,9 @@ class TestErrors(unittest.TestCase):
         self.assertFalse(self.render_handler.passed(func))
         self.assertIn(LiveValueError.MSG, self.logger)
 
-    def test_encode(self):
-        if six.PY3:
-            return
-
-        def func():
-            copyright = u'©'
-            with open('/tmp/lpremailer.html', 'w') as f:
-                f.write(copyright)
-        self.assertFalse(self.render_handler.passed(func))
-        self.assertIn(LiveUnicodeEncodeError.MSG, self.logger)
-
-    def test_decode(self):
-        if six.PY3:
-            return
-
-        def func():
-            self.j2_env.from_string('\xa9')
-        self.assertFalse(self.render_handler.passed(func))
-        self.assertIn(LiveUnicodeDecodeError.MSG, self.logger)
-
     def test_json_decode(self):
         def func():
             _json = "{'copyright': '\xa9'}"
             json.loads(_json, object_hook=object_hook)
         self.assertFalse(self.render_handler.passed(func))
-        if six.PY3:
-            self.assertIn(LiveJSONDecodeError.MSG, self.logger)
-        else:
-            self.assertIn(LiveValueError.MSG, self.logger)
+        self.assertIn(LiveJSONDecodeError.MSG, self.logger)
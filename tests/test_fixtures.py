@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from lpremailer.utils import FixtureCache, compile_lambda, lambdas
+
+
+def test_fixture_cached(tmpdir):
+    fixture = tmpdir.join('hello_dev.json')
+    fixture.write('{"request": {"static_url": "lambda x: x.upper()"}}')
+    fixtures = FixtureCache()
+    data = fixtures.load(str(fixture))
+    assert data['request']['static_url']('logo') == 'LOGO'
+    assert fixtures.load(str(fixture)) is data
+
+    fixture.write('{"request": {"static_url": "lambda x: x.lower()"}}')
+    fixture.setmtime(fixture.mtime() + 10)
+    data = fixtures.load(str(fixture))
+    assert data['request']['static_url']('LOGO') == 'logo'
+
+
+def test_lambdas_compiled_once():
+    source = 'lambda x: "compiled {}".format(x)'
+    assert compile_lambda(source)(1) == 'compiled 1'
+    code = lambdas.get((source, False))
+    assert compile_lambda(source)(2) == 'compiled 2'
+    assert lambdas.get((source, False)) is code
+
+
+@pytest.mark.parametrize('source', [
+    '__import__("os").getcwd()',
+    'lambda x: x.__class__',
+    'lambda x: __import__("os")',
+])
+def test_restricted(source):
+    compile_lambda(source)
+    with pytest.raises(ValueError):
+        compile_lambda(source, restricted=True)
+    assert compile_lambda('lambda x: x', restricted=True)(1) == 1
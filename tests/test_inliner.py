@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+
+import mock
+import pytest
+from premailer import Premailer
+
+from lpremailer.inliner import StylesheetCache, transform
+
+
+HTML = """<html><head><link rel="stylesheet" href="mail.css"/></head>
+<body><p class="hi">Hello</p></body></html>"""
+
+
+@pytest.fixture
+def stylesheet(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    stylesheet = tmpdir.join('mail.css')
+    stylesheet.write('.hi { color: red; }')
+    return stylesheet
+
+
+def inline(stylesheets):
+    return transform(HTML, stylesheets, allow_loading_external_files=True)
+
+
+def test_stylesheet_parsed_once(stylesheet):
+    stylesheets = StylesheetCache()
+    parse = Premailer._parse_style_rules
+    with mock.patch.object(Premailer, '_parse_style_rules', autospec=True,
+                           side_effect=parse) as parse_mock:
+        first = inline(stylesheets)
+        second = inline(stylesheets)
+    assert parse_mock.call_count == 1
+    assert first == second
+    assert 'style="color:red"' in first
+
+
+def test_stylesheet_changed(stylesheet):
+    stylesheets = StylesheetCache()
+    inline(stylesheets)
+    stylesheet.write('.hi { color: blue; }')
+    assert 'style="color:blue"' in inline(stylesheets)
+
+    stylesheet.write('.hi { color: gray; }')
+    mtime = os.stat(str(stylesheet)).st_mtime
+    os.utime(str(stylesheet), (mtime, mtime))
+    stylesheets.invalidate(str(stylesheet))
+    assert 'style="color:gray"' in inline(stylesheets)
@@ -18,9 +18,8 @@ def test_to_json(self, *args):
     handler = RenderHandler(cmd_args)
     path = os.path.dirname(os.path.abspath(__file__))
     path = os.path.join(path, 'templates')
-    generator = JsonGenerator(handler, path)
-    generator.handler.filebase = 'index_dev'
-    result = generator.feed()
+    generator = JsonGenerator(handler)
+    result = generator.feed(os.path.join(path, 'index_dev.html'))
     expected = {
         'alone_guy': 'dummy',
         'condition': 'dummy',
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from lpremailer.jobs import JobQueue, RenderJob
+
+
+def test_render_job():
+    job = RenderJob('/home/turkus/mail/greetings_dev.html')
+    assert job.path == '/home/turkus/mail'
+    assert job.filebase == 'greetings_dev'
+    assert job.ext == '.html'
+
+
+def test_pending_duplicates_dropped():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def func(key):
+        calls.append(key)
+        if key == 'block':
+            started.set()
+            release.wait(5)
+
+    queue = JobQueue(func, workers=1)
+    queue.submit('block')
+    started.wait(5)
+    first = queue.submit('greetings')
+    assert queue.submit('greetings') is first
+    release.set()
+    first.result(5)
+    queue.shutdown()
+    assert calls == ['block', 'greetings']
+    assert not queue.running
+
+
+def test_independent_jobs_concurrent():
+    barrier = threading.Barrier(2, timeout=5)
+    queue = JobQueue(lambda key: barrier.wait(), workers=2)
+    futures = [queue.submit('greetings'), queue.submit('goodbye')]
+    for future in futures:
+        future.result(5)
+    queue.shutdown()
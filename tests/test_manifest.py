@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import argparse
+
+import pytest
+
+from lpremailer import RenderHandler
+from lpremailer.manifest import Manifest
+
+
+@pytest.fixture
+def tree(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr('lpremailer.main.HERE', str(tmpdir))
+    tmpdir.join('_footer.html').write('<p>footer</p>')
+    tmpdir.join('hello_dev.html').write(
+        "{% raw %}<p>Hello {{ name }}!</p>{% endraw %}"
+        "{% include '_footer.html' %}")
+    tmpdir.join('hello_dev.json').write('{"name": "turkus"}')
+    return tmpdir
+
+
+def handler(**options):
+    cmd_args = argparse.Namespace(loadhistory=False, devpostfix='_dev',
+                                  livepostfix='_live', astext=False)
+    vars(cmd_args).update(options)
+    return RenderHandler(cmd_args)
+
+
+def outdated(manifest, tree, filename='hello_dev.html', **options):
+    return manifest.outdated(str(tree.join(filename)),
+                             handler(**options).render_options())
+
+
+def rendered_manifest(tree):
+    render_handler = handler()
+    filepath = str(tree.join('lpremailer.manifest'))
+    render_handler.manifest = Manifest(filepath, str(tree))
+    render_handler.proceed(str(tree.join('hello_dev.html')))
+    render_handler.manifest.save()
+    manifest = Manifest(filepath, str(tree))
+    manifest.load()
+    return manifest
+
+
+def test_up_to_date(tree):
+    manifest = rendered_manifest(tree)
+    entry = manifest.entries['hello_dev.html']
+    assert sorted(entry['inputs']) == [
+        '_footer.html', 'hello_dev.html', 'hello_dev.json']
+    assert sorted(entry['outputs']) == ['hello.html', 'hello_dev_live.html']
+    assert not outdated(manifest, tree)
+    assert outdated(manifest, tree, 'other_dev.html')
+
+
+def test_touched_but_unchanged(tree):
+    manifest = rendered_manifest(tree)
+    tree.join('_footer.html').setmtime(1)
+    assert not outdated(manifest, tree)
+
+
+@pytest.mark.parametrize('filename', ['_footer.html', 'hello_dev.json',
+                                      'hello_dev_live.html'])
+def test_changed(tree, filename):
+    manifest = rendered_manifest(tree)
+    tree.join(filename).write('{}')
+    assert outdated(manifest, tree)
+
+
+def test_output_removed(tree):
+    manifest = rendered_manifest(tree)
+    tree.join('hello.html').remove()
+    assert outdated(manifest, tree)
+
+
+@pytest.mark.parametrize('options', [
+    {'astext': True}, {'devpostfix': '_draft'}, {'locales': 'de'},
+    {'assets': True}])
+def test_options_changed(tree, options):
+    manifest = rendered_manifest(tree)
+    assert outdated(manifest, tree, **options)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+
+import pytest
+
+from lpremailer import RenderHandler
+from lpremailer.merge import MailMerge, records
+
+
+TEMPLATE = """<html>
+<head><style>.hi { color: red; }</style></head>
+<body>{% raw %}<p class="hi">{{ request.greet(name) }}</p>{% endraw %}</body>
+</html>
+"""
+
+
+@pytest.fixture
+def tree(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr('lpremailer.main.HERE', str(tmpdir))
+    tmpdir.join('hello_dev.html').write(TEMPLATE)
+    tmpdir.join('hello_dev.json').write(
+        '{"request": {"greet": "lambda x: \\"Hello \\" + x"}}')
+    return tmpdir
+
+
+@pytest.mark.parametrize('array', [True, False])
+def test_records(tmpdir, array):
+    rows = [{'name': 'name {}'.format(index), 'run': 'lambda x: x'}
+            for index in range(50)]
+    filepath = tmpdir.join('records.json')
+    if array:
+        filepath.write(json.dumps(rows, indent=4))
+    else:
+        filepath.write('\n'.join(json.dumps(row) for row in rows))
+    loaded = list(records(str(filepath), chunk_size=16))
+    assert [row['name'] for row in loaded] == [row['name'] for row in rows]
+
+
+@pytest.mark.parametrize('content', [
+    '[{"a": 1} {"b": 2}]',
+    '[,{"a": 1}]',
+    '[{"a": 1},,{"b": 2}]',
+    '[{"a": 1},]',
+    '[{"a": 1}',
+])
+def test_malformed_records(tmpdir, content):
+    filepath = tmpdir.join('records.json')
+    filepath.write(content)
+    with pytest.raises(ValueError):
+        list(records(str(filepath), chunk_size=4))
+
+
+def test_empty_records(tmpdir):
+    filepath = tmpdir.join('records.json')
+    filepath.write('[ ]')
+    assert list(records(str(filepath))) == []
+
+
+def test_merge(tree):
+    rows = [{'name': 'turkus'}, {'name': 1}, {'name': 'rola'}]
+    tree.join('records.jsonl').write(
+        '\n'.join(json.dumps(row) for row in rows))
+    cmd_args = argparse.Namespace(loadhistory=False, devpostfix='_dev',
+                                  livepostfix='_live', astext=False)
+    mail_merge = MailMerge(RenderHandler(cmd_args),
+                           str(tree.join('hello_dev.html')), batch_size=2)
+    assert not mail_merge.run(str(tree.join('records.jsonl')))
+    assert (mail_merge.rendered, mail_merge.failed) == (2, 1)
+    merged = tree.join('hello_merge')
+    assert 'style="color:red"' in merged.join('hello_1.html').read()
+    assert 'Hello rola' in merged.join('hello_3.html').read()
+    assert not merged.join('hello_2.html').exists()
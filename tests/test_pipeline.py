@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+import argparse
+import os
+import pstats
+import shutil
+
+import mock
+
+import pytest
+from lpremailer.inliner import transform
+from watchdog.events import (DirCreatedEvent, FileCreatedEvent,
+                             FileDeletedEvent, FileModifiedEvent,
+                             FileMovedEvent)
+
+from lpremailer import RenderHandler
+from lpremailer.events import OUTPUTS, Change
+from lpremailer.main import LivePremailer, cache_budget
+from lpremailer.utils import IGNORE_PATTERNS, watches
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'examples')
+TEMPLATE = """<html>
+<head><style>.hi { color: red; }</style></head>
+<body>{% raw %}<p class="hi">Hello {{ name }}!</p>{% endraw %}</body>
+</html>
+"""
+
+
+@pytest.fixture
+def tree(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr('lpremailer.main.HERE', str(tmpdir))
+    tmpdir.join('hello_dev.html').write(TEMPLATE)
+    tmpdir.join('hello_dev.json').write('{"name": "turkus"}')
+    return tmpdir
+
+
+def handler(**options):
+    cmd_args = argparse.Namespace(loadhistory=False, devpostfix='_dev',
+                                  livepostfix='_live', astext=False)
+    vars(cmd_args).update(options)
+    return RenderHandler(cmd_args)
+
+
+@mock.patch('lpremailer.inliner.transform', side_effect=transform)
+def test_single_transform(transform_mock, tree):
+    handler().proceed(str(tree.join('hello_dev.html')))
+    assert transform_mock.call_count == 1
+    premailed = tree.join('hello.html').read()
+    live = tree.join('hello_dev_live.html').read()
+    assert 'style="color:red"' in premailed
+    assert '{{ name }}' in premailed
+    assert 'Hello turkus!' in live
+
+
+def test_templates_cached(tree):
+    render_handler = handler()
+    src_path = str(tree.join('hello_dev.html'))
+    render_handler.proceed(src_path)
+    template = render_handler.j2_env.get_template('hello_dev.html')
+    render_handler.proceed(src_path)
+    assert render_handler.j2_env.get_template('hello_dev.html') is template
+    assert len(render_handler.live_templates) == 1
+
+    tree.join('hello_dev.html').write(TEMPLATE.replace('red', 'blue'))
+    stat = os.stat(src_path)
+    os.utime(src_path, (stat.st_atime, stat.st_mtime + 1))
+    render_handler.proceed(src_path)
+    assert render_handler.j2_env.get_template('hello_dev.html') \
+        is not template
+    assert len(render_handler.live_templates) == 2
+    assert 'color:blue' in tree.join('hello_dev_live.html').read()
+
+
+def test_bytecode_cache(tree):
+    cachedir = tree.join('cache')
+    handler(cachedir=str(cachedir)).proceed(str(tree.join('hello_dev.html')))
+    assert cachedir.join('bytecode').listdir()
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_build(tree, jobs):
+    tree.mkdir('broken').join('oops_dev.html').write('{% include "no.html" %}')
+    tree.join('broken', 'oops_dev.json').write('{}')
+    live_premailer = LivePremailer()
+    live_premailer.args = argparse.Namespace(
+        which='build', jobs=jobs, loadhistory=False, devpostfix='_dev',
+        livepostfix='_live', astext=False)
+    with pytest.raises(SystemExit) as exit_info:
+        live_premailer.build()
+    assert exit_info.value.code == 1
+    assert 'Hello turkus!' in tree.join('hello_dev_live.html').read()
+
+
+def write_translations(localedir, locale, messages):
+    from babel.messages.catalog import Catalog
+    from babel.messages.mofile import write_mo
+    catalog = Catalog(locale=locale)
+    for msgid, msgstr in messages.items():
+        catalog.add(msgid, msgstr)
+    directory = localedir.ensure(locale, 'LC_MESSAGES', dir=True)
+    with open(str(directory.join('messages.mo')), 'wb') as f:
+        write_mo(f, catalog)
+
+
+@mock.patch('lpremailer.inliner.transform', side_effect=transform)
+def test_locales(transform_mock, tree):
+    write_translations(tree.join('locale'), 'de', {'Hello': 'Hallo'})
+    tree.join('hello_dev.html').write(
+        TEMPLATE.replace('Hello', '{{ _("Hello") }}'))
+    render_handler = handler(locales='de,pl', localedir='locale')
+    assert render_handler.proceed(str(tree.join('hello_dev.html')))
+    assert 'Hallo turkus!' in tree.join('hello_dev_live_de.html').read()
+    assert 'Hello turkus!' in tree.join('hello_dev_live_pl.html').read()
+    assert 'style="color:red"' in tree.join('hello_pl.html').read()
+    assert not tree.join('hello_dev_live.html').exists()
+    assert transform_mock.call_count == 1
+    render_handler.stop()
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_init(tree, jobs):
+    tree.join('_partial.html').write(
+        '{% raw %}<p>{{ greeting }}</p>{% endraw %}')
+    tree.join('hi_dev.html').write('{% include "_partial.html" %}')
+    tree.mkdir('node_modules').join('lib_dev.html').write('{{ name }}')
+    live_premailer = LivePremailer()
+    live_premailer.args = argparse.Namespace(
+        which='init', jobs=jobs, force=False, loadhistory=False,
+        devpostfix='_dev', livepostfix='_live', astext=False)
+    live_premailer.generate_json()
+    fixture = tree.join('hi_dev.json')
+    assert 'greeting' in fixture.read()
+    assert not tree.join('node_modules', 'lib_dev.json').exists()
+
+    fixture.write('{"greeting": "hi"}')
+    mtime = tree.join('_partial.html').mtime()
+    fixture.setmtime(mtime + 10)
+    live_premailer.generate_json()
+    assert fixture.read() == '{"greeting": "hi"}'
+
+    tree.join('_partial.html').setmtime(mtime + 20)
+    live_premailer.generate_json()
+    assert fixture.read() != '{"greeting": "hi"}'
+
+    fixture.write('{"greeting": "hi"}')
+    fixture.setmtime(mtime + 30)
+    live_premailer.args.force = True
+    live_premailer.generate_json()
+    assert fixture.read() != '{"greeting": "hi"}'
+
+
+def test_init_stylesheet(tree):
+    tree.join('mail.css').write('.hi { color: blue; }')
+    tree.join('hi_dev.html').write(
+        '<link rel="stylesheet" href="mail.css">'
+        '{% raw %}<p>{{ greeting }}</p>{% endraw %}')
+    live_premailer = LivePremailer()
+    live_premailer.args = argparse.Namespace(
+        which='init', jobs=1, force=False, loadhistory=False,
+        devpostfix='_dev', livepostfix='_live', astext=False)
+    live_premailer.generate_json()
+    fixture = tree.join('hi_dev.json')
+    fixture.write('{"greeting": "hi"}')
+    mtime = tree.join('hi_dev.html').mtime()
+    fixture.setmtime(mtime + 10)
+    tree.join('mail.css').setmtime(mtime + 20)
+    live_premailer.generate_json()
+    assert fixture.read() == '{"greeting": "hi"}'
+
+
+@mock.patch('lpremailer.inliner.transform', side_effect=transform)
+def test_render_cache(transform_mock, tree):
+    cachedir = str(tree.join('cache'))
+    src_path = str(tree.join('hello_dev.html'))
+    live = tree.join('hello_dev_live.html')
+    handler(cachedir=cachedir).proceed(src_path)
+    mtime = live.mtime()
+    live.setmtime(mtime - 10)
+
+    assert handler(cachedir=cachedir).proceed(src_path)
+    assert transform_mock.call_count == 1
+    assert live.mtime() == mtime - 10
+
+    tree.join('hello.html').remove()
+    handler(cachedir=cachedir).proceed(src_path)
+    assert transform_mock.call_count == 1
+    assert '{{ name }}' in tree.join('hello.html').read()
+
+    tree.join('hello_dev.json').write('{"name": "rola"}')
+    handler(cachedir=cachedir).proceed(src_path)
+    assert transform_mock.call_count == 2
+    assert 'Hello rola!' in live.read()
+
+
+@mock.patch('lpremailer.inliner.transform', side_effect=transform)
+def test_layout_cache(transform_mock, tree):
+    render_handler = handler(astext=True)
+    src_path = str(tree.join('hello_dev.html'))
+    render_handler.proceed(src_path)
+    text = tree.join('hello_txt.html').read()
+
+    tree.join('hello_dev.json').write('{"name": "rola"}')
+    render_handler.proceed(src_path)
+    assert transform_mock.call_count == 1
+    assert 'Hello rola!' in tree.join('hello_dev_live.html').read()
+    assert tree.join('hello_txt.html').read() == text
+
+    tree.join('hello_dev.html').write(TEMPLATE.replace('red', 'blue'))
+    render_handler.proceed(src_path)
+    assert transform_mock.call_count == 2
+    assert 'style="color:blue"' in tree.join('hello.html').read()
+
+
+def test_assets(tree):
+    tree.join('hello_dev.html').write(
+        TEMPLATE.replace('<p', '<img src="logo.png"><p'))
+    image = tree.join('logo.png')
+    image.write_binary(b'logo')
+    render_handler = handler(assets=True, inlinelimit=2)
+    src_path = str(tree.join('hello_dev.html'))
+    render_handler.proceed(src_path)
+    digest = render_handler.assets.get(str(image)).digest
+    assert 'logo.png?v={}'.format(digest[:12]) in \
+        tree.join('hello.html').read()
+
+    image.write_binary(b'lo')
+    assert render_handler.targets(str(image)) == {src_path}
+    render_handler.proceed(src_path)
+    assert 'src="data:image/png;base64,bG8="' in \
+        tree.join('hello_dev_live.html').read()
+
+
+def test_assets_render_cache(tree):
+    tree.join('hello_dev.html').write(
+        TEMPLATE.replace('<p', '<img src="logo.png"><p'))
+    image = tree.join('logo.png')
+    image.write_binary(b'logo')
+    cachedir = str(tree.join('cache'))
+    src_path = str(tree.join('hello_dev.html'))
+    handler(assets=True, inlinelimit=2, cachedir=cachedir).proceed(src_path)
+
+    render_handler = handler(assets=True, inlinelimit=2, cachedir=cachedir)
+    render_handler.proceed(src_path)
+    assert render_handler.render_cache.hits == 1
+    assert render_handler.targets(str(image)) == {src_path}
+
+    image.write_binary(b'lo')
+    render_handler = handler(assets=True, inlinelimit=2, cachedir=cachedir)
+    render_handler.proceed(src_path)
+    assert render_handler.render_cache.hits == 0
+    assert 'src="data:image/png;base64,bG8="' in \
+        tree.join('hello_dev_live.html').read()
+
+
+def test_assets_next_to_template(tree):
+    mail = tree.mkdir('mail')
+    mail.join('hi_dev.html').write(
+        TEMPLATE.replace('<p', '<img src="img/logo.png"><p'))
+    mail.join('hi_dev.json').write('{"name": "turkus"}')
+    mail.mkdir('img').join('logo.png').write_binary(b'logo')
+    render_handler = handler(assets=True)
+    render_handler.proceed(str(mail.join('hi_dev.html')))
+    assert 'src="data:image/png;base64,bG9nbw=="' in \
+        mail.join('hi.html').read()
+
+
+def test_template_outside_cwd(tree, monkeypatch):
+    mail = tree.mkdir('mail')
+    monkeypatch.chdir(mail)
+    monkeypatch.setattr('lpremailer.main.HERE', str(mail))
+    handler().proceed(str(tree.join('hello_dev.html')))
+    assert 'Hello turkus!' in tree.join('hello_dev_live.html').read()
+    assert 'style="color:red"' in tree.join('hello.html').read()
+
+
+def test_render_cache_staticdir(tree):
+    tree.join('hello_dev.html').write(
+        TEMPLATE.replace('<p', '<img src="img/logo.png"><p'))
+    staticdir = tree.mkdir('static')
+    staticdir.mkdir('img').join('logo.png').write_binary(b'logo')
+    cachedir = str(tree.join('cache'))
+    src_path = str(tree.join('hello_dev.html'))
+    handler(assets=True, inlinelimit=2, cachedir=cachedir).proceed(src_path)
+    assert 'src="img/logo.png"' in tree.join('hello.html').read()
+
+    render_handler = handler(assets=True, inlinelimit=2, cachedir=cachedir,
+                             staticdir=str(staticdir))
+    render_handler.proceed(src_path)
+    assert render_handler.render_cache.hits == 0
+    assert 'src="img/logo.png?v=' in tree.join('hello.html').read()
+
+
+def test_assets_example(tmpdir, monkeypatch):
+    project = tmpdir.join('mybigproject')
+    shutil.copytree(os.path.join(EXAMPLES, 'mybigproject'), str(project))
+    mail = project.join('templates', 'mail')
+    monkeypatch.chdir(mail)
+    monkeypatch.setattr('lpremailer.main.HERE', str(mail))
+    src_path = str(mail.join('hello', 'greetings_dev.html'))
+    image = str(project.join('static', 'img', 'mail', 'logo.png'))
+    render_handler = handler(assets=True, staticdir=str(project))
+    render_handler.proceed(src_path)
+    digest = render_handler.assets.get(image).digest
+    assert "static_url('static/img/mail/logo.png') }}}}?v={}".format(
+        digest[:12]) in mail.join('hello', 'greetings.html').read()
+    assert '/static/img/mail/logo.png?v={}'.format(digest[:12]) in \
+        mail.join('hello', 'greetings_dev_live.html').read()
+    assert render_handler.targets(image) == {src_path}
+
+    handler(assets=True, staticdir=str(project),
+            inlinelimit=100000).proceed(src_path)
+    assert 'src="data:image/png;base64,' in \
+        mail.join('hello', 'greetings.html').read()
+
+
+def test_debounced_events(tree):
+    render_handler = handler(debounce=1000)
+    src_path = str(tree.join('hello_dev.html'))
+    json_path = str(tree.join('hello_dev.json'))
+    tmp_path = str(tree.join('.hello_dev.html.swp'))
+    with mock.patch.object(render_handler, 'proceed') as proceed:
+        render_handler.on_created(FileCreatedEvent(tmp_path))
+        render_handler.on_moved(FileMovedEvent(tmp_path, src_path))
+        render_handler.on_modified(FileModifiedEvent(src_path))
+        render_handler.on_modified(FileModifiedEvent(json_path))
+        render_handler.on_modified(FileModifiedEvent(
+            str(tree.join('hello_dev_live.html'))))
+        assert not proceed.called
+        render_handler.timer.cancel()
+        render_handler.flush()
+    proceed.assert_called_once_with(src_path)
+
+
+def test_roles(tree):
+    tree.join('_footer.html').write('footer')
+    tree.join('mail.css').write('.hi { color: blue; }')
+    tree.join('node_modules').mkdir().join('lib_dev.html').write(TEMPLATE)
+    render_handler = handler(include=['*.html', '*.json'])
+    render_handler.proceed(str(tree.join('hello_dev.html')))
+    roles = dict((filename, render_handler.role(str(tree.join(filename))))
+                 for filename in ('hello_dev.html', 'hello_dev.json',
+                                  '_footer.html', 'hello.html',
+                                  'hello_dev_live.html', 'mail.css',
+                                  'node_modules/lib_dev.html'))
+    assert roles == {
+        'hello_dev.html': RenderHandler.ROLE_DEV,
+        'hello_dev.json': RenderHandler.ROLE_FIXTURE,
+        '_footer.html': RenderHandler.ROLE_PARTIAL,
+        'hello.html': RenderHandler.ROLE_OUTPUT,
+        'hello_dev_live.html': RenderHandler.ROLE_OUTPUT,
+        'mail.css': None,
+        'node_modules/lib_dev.html': None,
+    }
+
+
+def test_include_indexed(tree):
+    tree.mkdir('a').join('x_dev.html').write(TEMPLATE)
+    tree.mkdir('b').join('x_dev.html').write(TEMPLATE)
+    render_handler = handler(include=['a/*'])
+    render_handler.index_templates()
+    assert render_handler.role(str(tree.join('a', 'x_dev.html'))) == \
+        RenderHandler.ROLE_DEV
+    assert render_handler.role(str(tree.join('b', 'x_dev.html'))) is None
+
+
+def test_outputs_ignored(tree):
+    render_handler = handler()
+    watched = []
+    render_handler.watch = watched.append
+    with mock.patch.object(render_handler, 'schedule') as schedule:
+        for filename in ('hello.html', 'hello_txt.html',
+                         'hello_dev_live.html', 'notes.txt'):
+            render_handler.dispatch(FileModifiedEvent(
+                str(tree.join(filename))))
+        assert not schedule.called
+        render_handler.dispatch(DirCreatedEvent(str(tree.join('.git'))))
+        render_handler.dispatch(DirCreatedEvent(str(tree.join('mails'))))
+        render_handler.dispatch(FileModifiedEvent(
+            str(tree.join('hello_dev.html'))))
+    schedule.assert_called_once_with(str(tree.join('hello_dev.html')))
+    assert watched == [str(tree.join('mails'))]
+
+
+def test_watches(tree):
+    for directory in ('node_modules', 'mails', 'dist'):
+        tree.join(directory).mkdir().join('a').mkdir()
+    assert list(watches(str(tree), IGNORE_PATTERNS + ('dist',))) == [
+        (str(tree), False),
+        (str(tree.join('mails')), True),
+    ]
+
+
+def test_cache_stats(tree):
+    render_handler = handler(cachebudget=[('layouts', 0.001)])
+    src_path = str(tree.join('hello_dev.html'))
+    render_handler.proceed(src_path)
+    render_handler.proceed(src_path)
+    stats = render_handler.cache_stats()
+    assert stats['renders']['entries'] == 1
+    assert stats['renders']['hits'] == 1
+    assert stats['fixtures']['bytes'] > 0
+    assert stats['stylesheet rules']['entries'] == 1
+    assert stats['layouts']['bytes'] <= 1048
+    assert stats['templates']['entries'] == 1
+    assert stats['templates']['bytes'] == len(TEMPLATE)
+    assert stats['templates']['misses'] == 1
+
+    render_handler.history.add('./hello_dev.html')
+    render_handler.dispatch(FileDeletedEvent(src_path))
+    assert not render_handler.history
+    assert src_path not in render_handler.generations
+
+
+def test_cache_budget():
+    assert cache_budget('renders=128') == ('renders', 128)
+    with pytest.raises(argparse.ArgumentTypeError):
+        cache_budget('everything=1')
+
+
+def test_history_fan_out(tree):
+    tree.join('bye_dev.html').write(TEMPLATE.replace('Hello', 'Bye'))
+    tree.join('bye_dev.json').write('{"name": "turkus"}')
+    render_handler = handler(workers=2)
+    render_handler.history = {'hello_dev.html', 'bye_dev.html'}
+    render_handler.history_proceed()
+    render_handler.stop()
+    assert 'Hello turkus!' in tree.join('hello_dev_live.html').read()
+    assert 'Bye turkus!' in tree.join('bye_dev_live.html').read()
+
+
+def test_superseded_render(tree):
+    render_handler = handler()
+    src_path = str(tree.join('hello_dev.html'))
+    inline = render_handler.inline
+
+    def edited_while_inlining(job):
+        tree.join('hello_dev.json').write('{"name": "rola"}')
+        render_handler.supersede(src_path)
+        inline(job)
+
+    render_handler.funcs_sequence[2] = edited_while_inlining
+    assert not render_handler.proceed(src_path)
+    assert not tree.join('hello_dev_live.html').check()
+
+    render_handler.funcs_sequence[2] = inline
+    assert render_handler.proceed(src_path)
+    assert 'Hello rola!' in tree.join('hello_dev_live.html').read()
+
+
+def test_timings(tree):
+    render_handler = handler(profile=str(tree.join('profile')))
+    src_path = str(tree.join('hello_dev.html'))
+    render_handler.proceed(src_path)
+    tree.join('hello_dev.json').write('{"name": "rola"}')
+    render_handler.proceed(src_path)
+    summary = render_handler.stats.summary(src_path)
+    assert summary['count'] == 2
+    assert summary['p50'] <= summary['p95'] <= summary['max']
+    profiles = tree.join('profile').listdir()
+    assert len(profiles) == 2
+    assert pstats.Stats(str(profiles[0])).total_calls
+
+
+def test_announce_written(tree):
+    render_handler = handler()
+    announced = []
+    render_handler.subscribe(announced.append)
+    src_path = str(tree.join('hello_dev.html'))
+    render_handler.proceed(src_path)
+    tree.join('hello_dev.json').write('{"name": "rola"}')
+    render_handler.proceed(src_path)
+    render_handler.proceed(src_path)
+    assert announced == [
+        Change(OUTPUTS, [str(tree.join('hello.html')),
+                         str(tree.join('hello_dev_live.html'))]),
+        Change(OUTPUTS, [str(tree.join('hello_dev_live.html'))]),
+    ]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import argparse
+import threading
+
+import mock
+from jinja2 import Template
+
+from lpremailer import RenderHandler, Renderer
+from lpremailer.inliner import transform
+
+
+TEMPLATE = """<html>
+<head><link rel="stylesheet" href="/css/mail.css"/></head>
+<body>{% include "_partial.html" %}</body>
+</html>
+"""
+PARTIAL = '{% raw %}<p class="hi">Hello {{ name }}!</p>{% endraw %}'
+
+
+def write_tree(tmpdir):
+    templates = tmpdir.mkdir('templates')
+    templates.join('hello_dev.html').write(TEMPLATE)
+    templates.join('_partial.html').write(PARTIAL)
+    tmpdir.mkdir('static').mkdir('css').join('mail.css').write(
+        '.hi { color: red; }')
+    return templates
+
+
+@mock.patch('lpremailer.inliner.transform', side_effect=transform)
+def test_render(transform_mock, tmpdir):
+    templates = write_tree(tmpdir)
+    renderer = Renderer(str(templates), str(tmpdir.join('static')))
+    html, text = renderer.render('hello_dev.html', {'name': 'turkus'})
+    assert '<p class="hi" style="color:red">Hello turkus!</p>' in html
+    assert text.strip() == 'Hello turkus!'
+
+    results = []
+
+    def render(name):
+        results.append(renderer.render('hello_dev.html', {'name': name}))
+    threads = [threading.Thread(target=render, args=(str(index),))
+               for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(text.strip() for html, text in results) == \
+        ['Hello {}!'.format(index) for index in range(8)]
+
+    contexts = ({'name': str(index)} for index in range(3))
+    many = list(renderer.render_many('hello_dev.html', contexts))
+    assert [text.strip() for html, text in many] == \
+        ['Hello 0!', 'Hello 1!', 'Hello 2!']
+    assert transform_mock.call_count == 1
+
+
+def test_same_as_preview(tmpdir, monkeypatch):
+    templates = write_tree(tmpdir)
+    templates.join('hello_dev.html').write(
+        TEMPLATE.replace('/css/mail.css', '../static/css/mail.css'))
+    templates.join('hello_dev.json').write('{"name": "turkus"}')
+    monkeypatch.chdir(templates)
+    monkeypatch.setattr('lpremailer.main.HERE', str(templates))
+    cmd_args = argparse.Namespace(loadhistory=False, devpostfix='_dev',
+                                  livepostfix='_live', astext=True)
+    RenderHandler(cmd_args).proceed(str(templates.join('hello_dev.html')))
+    html, text = Renderer(str(templates)).render(
+        'hello_dev.html', {'name': 'turkus'})
+    assert html == templates.join('hello_dev_live.html').read()
+    text_template = Template(templates.join('hello_txt.html').read())
+    assert text == text_template.render(name='turkus')
+
+
+def test_auto_reload(tmpdir):
+    templates = write_tree(tmpdir)
+    renderer = Renderer(str(templates), str(tmpdir.join('static')),
+                        auto_reload=True)
+    assert 'Hello' in renderer.render('hello_dev.html', {'name': 'x'})[0]
+    partial = templates.join('_partial.html')
+    partial.write(PARTIAL.replace('Hello', 'Hi'))
+    partial.setmtime(partial.mtime() + 10)
+    assert 'Hi x!' in renderer.render('hello_dev.html', {'name': 'x'})[0]
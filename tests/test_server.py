@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import http.client
+import http.server
+import socket
+import threading
+import time
+
+import pytest
+
+from lpremailer.events import OUTPUTS, Change
+from lpremailer.server import EVENTS_PATH, BrowserSyncReloader, LiveServer
+
+
+@pytest.fixture
+def server(tmpdir):
+    tmpdir.mkdir('mail').join('hello_dev_live.html').write(
+        '<html><body>Hello</body></html>')
+    tmpdir.mkdir('static').join('mail.css').write('.hi { color: red; }')
+    tmpdir.join('secret.txt').write('secret')
+    server = LiveServer(str(tmpdir.join('mail')), str(tmpdir.join('static')),
+                        port=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def get(server, path):
+    connection = http.client.HTTPConnection(server.host, server.port,
+                                            timeout=5)
+    connection.request('GET', path)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def test_pages(server):
+    status, content = get(server, '/hello_dev_live.html')
+    assert status == 200
+    assert EVENTS_PATH.encode('utf8') in content
+    assert content.endswith(b'</body></html>')
+    assert get(server, '/mail.css') == (200, b'.hi { color: red; }')
+    assert b'hello_dev_live.html' in get(server, '/')[1]
+    assert get(server, '/../secret.txt')[0] == 404
+    assert get(server, '/missing.html')[0] == 404
+
+
+def events(server, page):
+    connection = socket.create_connection((server.host, server.port), 5)
+    request = 'GET {}?page={} HTTP/1.1\r\n\r\n'.format(EVENTS_PATH, page)
+    connection.sendall(request.encode('latin1'))
+    stream = connection.makefile('rb')
+    while stream.readline().strip():
+        pass
+    assert stream.readline() == b': ping\n'
+    stream.readline()
+    return connection, stream
+
+
+def test_reload_only_matching_pages(server, tmpdir):
+    hello, hello_stream = events(server, '/hello_dev_live.html')
+    other, other_stream = events(server, '/other_dev_live.html')
+    other.settimeout(0.5)
+    filepath = str(tmpdir.join('mail', 'hello_dev_live.html'))
+    server.notify(Change(OUTPUTS, [filepath]))
+    assert hello_stream.readline() == b'event: reload\n'
+    with pytest.raises(socket.timeout):
+        other_stream.readline()
+    hello.close()
+    other.close()
+
+
+def test_browser_sync_reloader():
+    requests = []
+    release = threading.Event()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            release.wait(5)
+            requests.append(self.path)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.HTTPServer(('localhost', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    reloader = BrowserSyncReloader(httpd.server_address[1])
+    start = time.time()
+    reloader.notify(Change(OUTPUTS, ['/mail/hello_dev_live.html']))
+    assert time.time() - start < 0.5
+    release.set()
+    reloader.stop()
+    httpd.shutdown()
+    assert requests == [
+        '/__browser_sync__?method=reload&args=%2Fmail%2Fhello_dev_live.html']
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+
+import pytest
+
+
+HEAVY_MODULES = ('babel', 'cssutils', 'html2text', 'jinja2', 'lxml',
+                 'premailer', 'random_words')
+IMPORT_BUDGET = 0.1
+
+
+def python(*args):
+    return subprocess.check_output((sys.executable,) + args,
+                                   stderr=subprocess.STDOUT)
+
+
+def test_heavy_modules_not_imported():
+    code = ('import sys, lpremailer.main; '
+            'print(" ".join(sorted(sys.modules)))')
+    modules = set(python('-c', code).decode('utf8').split())
+    assert not modules.intersection(HEAVY_MODULES)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='-X importtime needs python 3.7')
+def test_import_time():
+    output = python('-X', 'importtime', '-c', 'import lpremailer.main')
+    for line in output.decode('utf8').splitlines():
+        self_time, cumulative, name = line.split('|')
+        if name.strip() == 'lpremailer':
+            assert int(cumulative) / 1e6 < IMPORT_BUDGET
+            break
+    else:
+        assert False, 'lpremailer not imported'